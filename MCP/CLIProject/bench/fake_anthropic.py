@@ -0,0 +1,206 @@
+"""Local stand-in for the Anthropic Messages API, for benchmarks.
+
+Answers POST /v1/messages, streamed or not, with a scripted conversation:
+every user query is followed by `tool_rounds` responses that each call
+`tools_per_round` of the tools offered in the request, then by a text
+answer of `response_chars` characters. The script is derived from the
+request alone, so the server keeps no per-conversation state. Each response
+is delayed by `latency_ms`, and streamed responses spread their text over
+`stream_chunks` deltas.
+
+It runs in a background thread, so its delays don't block the event loop of
+the client being measured.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+class ScriptedModel:
+    def __init__(
+            self,
+            tool_rounds: int = 1,
+            tools_per_round: int = 2,
+            response_chars: int = 400,
+            latency_ms: float = 50.0,
+            stream_chunks: int = 20,
+    ):
+        self.tool_rounds = tool_rounds
+        self.tools_per_round = tools_per_round
+        self.response_chars = response_chars
+        self.latency_ms = latency_ms
+        self.stream_chunks = stream_chunks
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def _id(self, prefix: str) -> str:
+        with self._lock:
+            self._next_id += 1
+            return f"{prefix}_{self._next_id:08d}"
+
+    @staticmethod
+    def _rounds_so_far(messages: list[dict]) -> int:
+        """Counts the tool rounds since the last user message that is not a tool result."""
+        rounds = 0
+        for message in reversed(messages):
+            content = message["content"]
+            if message["role"] == "user":
+                if isinstance(content, str) or not any(block.get("type") == "tool_result" for block in content):
+                    break
+                rounds += 1
+        return rounds
+
+    @staticmethod
+    def _tool_input(tool: dict, round_index: int) -> dict:
+        properties = tool.get("input_schema", {}).get("properties", {})
+        if "doc_id" in properties:
+            return {"doc_id": f"doc_{round_index}.md"}
+        if "key" in properties:
+            return {"key": f"key_{round_index}"}
+        return {}
+
+    def respond(self, request: dict) -> dict:
+        """Returns the next scripted Message for the request."""
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency_ms / 1000)
+
+        messages = request["messages"]
+        tools = request.get("tools") or []
+        rounds = self._rounds_so_far(messages)
+
+        if tools and rounds < self.tool_rounds:
+            content = []
+            for i in range(self.tools_per_round):
+                tool = tools[(rounds * self.tools_per_round + i) % len(tools)]
+                content.append({
+                    "type": "tool_use",
+                    "id": self._id("toolu"),
+                    "name": tool["name"],
+                    "input": self._tool_input(tool, rounds),
+                })
+            stop_reason = "tool_use"
+        else:
+            text = ("The answer is forty-two. " * (self.response_chars // 25 + 1))[:self.response_chars]
+            content = [{"type": "text", "text": text}]
+            stop_reason = "end_turn"
+
+        request_bytes = len(json.dumps(request))
+        return {
+            "id": self._id("msg"),
+            "type": "message",
+            "role": "assistant",
+            "model": request.get("model", "fake"),
+            "content": content,
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": request_bytes // 4,
+                "output_tokens": len(json.dumps(content)) // 4,
+                "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": 0,
+            },
+        }
+
+    def stream_events(self, message: dict):
+        """Yields the server-sent events that stream `message`."""
+        yield "message_start", {
+            "type": "message_start",
+            "message": {
+                **message,
+                "content": [],
+                "stop_reason": None,
+                "usage": {**message["usage"], "output_tokens": 1},
+            },
+        }
+        for index, block in enumerate(message["content"]):
+            if block["type"] == "text":
+                yield "content_block_start", {"type": "content_block_start", "index": index, "content_block": {"type": "text", "text": ""}}
+                text = block["text"]
+                step = max(1, len(text) // self.stream_chunks)
+                for start in range(0, len(text), step):
+                    yield "content_block_delta", {
+                        "type": "content_block_delta",
+                        "index": index,
+                        "delta": {"type": "text_delta", "text": text[start:start + step]},
+                    }
+            else:
+                yield "content_block_start", {
+                    "type": "content_block_start",
+                    "index": index,
+                    "content_block": {**block, "input": {}},
+                }
+                yield "content_block_delta", {
+                    "type": "content_block_delta",
+                    "index": index,
+                    "delta": {"type": "input_json_delta", "partial_json": json.dumps(block["input"])},
+                }
+            yield "content_block_stop", {"type": "content_block_stop", "index": index}
+
+        yield "message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+            "usage": {"output_tokens": message["usage"]["output_tokens"]},
+        }
+        yield "message_stop", {"type": "message_stop"}
+
+def _make_handler(model: ScriptedModel):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.startswith("/v1/messages"):
+                self.send_error(404)
+                return
+
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            message = model.respond(request)
+
+            if not request.get("stream"):
+                body = json.dumps(message).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for event, data in model.stream_events(message):
+                self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+                self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+class FakeAnthropicServer:
+    """Serves a ScriptedModel on localhost. Use as a context manager; `base_url` is set once started."""
+
+    def __init__(self, model: ScriptedModel, port: int = 0):
+        self.model = model
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(model))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,278 @@
+"""Offline end-to-end benchmark for the MCP chat stack.
+
+Runs CliChat against a local fake of the Anthropic Messages API and a
+synthetic MCP server, so no API key or network access is needed:
+
+    python -m bench.run --name baseline --turns 20 --tools 20 --docs 200 --payload-bytes 4096
+    python -m bench.run --name candidate --compare bench/results/baseline.json
+
+Every turn mentions `--mentions` documents and is answered after
+`--tool-rounds` rounds of `--tools-per-round` tool calls. For each turn the
+wall-clock latency, the MCP round-trips (cache hits excluded), the time the
+event loop was blocked and the memory in use are recorded. The summary and
+the per-span stats of the run are written as JSON to bench/results/<name>.json,
+with stable key order so that results can be diffed between commits.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from bench.fake_anthropic import FakeAnthropicServer, ScriptedModel
+from core.telemetry import tracer, percentile
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# summary metrics where a higher value is a regression
+LOWER_IS_BETTER = (
+    "turn_p50_ms",
+    "turn_p95_ms",
+    "turn_max_ms",
+    "mcp_round_trips_per_turn",
+    "model_calls_per_turn",
+    "loop_blocked_ms_per_turn",
+    "loop_max_lag_ms",
+    "peak_traced_kb",
+    "peak_rss_mb",
+)
+
+class LoopLagMonitor:
+    """Measures how long the event loop is blocked.
+
+    A task sleeps for `interval` seconds at a time; any time it oversleeps
+    is time the loop spent running something that did not yield.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - started - self.interval
+            if lag > 0:
+                self.blocked += lag
+                self.max_lag = max(self.max_lag, lag)
+
+    def reset(self):
+        self.blocked = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _span_counts() -> dict[str, int]:
+    return {name: s["count"] for name, s in tracer.stats().items()}
+
+def _mcp_round_trips(before: dict[str, int], after: dict[str, int]) -> int:
+    """MCP requests that reached a server between two span snapshots."""
+    return sum(
+        count - before.get(name, 0)
+        for name, count in after.items()
+        if name.startswith("mcp.") and not name.endswith(".cache_hit") and name != "mcp.connect"
+    )
+
+def _query(turn: int, mentions: int, docs: int) -> str:
+    mentioned = " ".join(f"@doc_{(turn + i) % docs}.md" for i in range(mentions))
+    return f"Summarize what {mentioned} say about topic {turn % 17}."
+
+async def run_benchmark(args) -> dict:
+    # imported here so that the fake endpoint is configured before the SDK reads its settings
+    from core.claude import Claude
+    from core.cli_chat import CliChat
+    from mcp_client import MCP_Client
+
+    model = ScriptedModel(
+        tool_rounds=args.tool_rounds,
+        tools_per_round=args.tools_per_round,
+        response_chars=args.response_chars,
+        latency_ms=args.model_latency_ms,
+    )
+    turns = []
+
+    with FakeAnthropicServer(model) as server:
+        os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+        os.environ["ANTHROPIC_API_KEY"] = "bench"
+
+        client = MCP_Client(
+            command=sys.executable,
+            args=[
+                "-m", "bench.synthetic_server",
+                "--tools", str(args.tools),
+                "--docs", str(args.docs),
+                "--payload-bytes", str(args.payload_bytes),
+                "--tool-delay-ms", str(args.tool_delay_ms),
+            ],
+        )
+        async with client:
+            chat = CliChat(
+                doc_client=client,
+                clients={"doc_client": client},
+                claude_service=Claude(model="fake-model"),
+                token_budget=args.token_budget,
+            )
+            monitor = LoopLagMonitor()
+            monitor.start()
+            tracer.reset()
+            if args.trace_memory:
+                tracemalloc.start()
+
+            try:
+                for turn in range(args.turns):
+                    query = _query(turn, args.mentions, args.docs)
+                    counts = _span_counts()
+                    requests = model.requests
+                    monitor.reset()
+                    if args.trace_memory:
+                        tracemalloc.reset_peak()
+
+                    started = time.perf_counter()
+                    # Chat.run prints the text of tool_use responses when not streaming
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        await chat.run(query, stream=args.stream)
+                    elapsed = time.perf_counter() - started
+
+                    turns.append({
+                        "latency": elapsed,
+                        "mcp_round_trips": _mcp_round_trips(counts, _span_counts()),
+                        "model_calls": model.requests - requests,
+                        "loop_blocked": monitor.blocked,
+                        "loop_max_lag": monitor.max_lag,
+                        "peak_traced": tracemalloc.get_traced_memory()[1] if args.trace_memory else 0,
+                    })
+            finally:
+                if args.trace_memory:
+                    tracemalloc.stop()
+                await monitor.stop()
+
+    return summarize(args, turns)
+
+def summarize(args, turns: list[dict]) -> dict:
+    latencies = sorted(turn["latency"] for turn in turns)
+    count = len(turns) or 1
+    summary = {
+        "turn_p50_ms": percentile(latencies, 50) * 1000,
+        "turn_p95_ms": percentile(latencies, 95) * 1000,
+        "turn_max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        "turns_per_second": len(turns) / sum(latencies) if latencies else 0.0,
+        "mcp_round_trips_per_turn": sum(turn["mcp_round_trips"] for turn in turns) / count,
+        "model_calls_per_turn": sum(turn["model_calls"] for turn in turns) / count,
+        "loop_blocked_ms_per_turn": sum(turn["loop_blocked"] for turn in turns) / count * 1000,
+        "loop_max_lag_ms": max((turn["loop_max_lag"] for turn in turns), default=0.0) * 1000,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    if args.trace_memory:
+        summary["peak_traced_kb"] = max(turn["peak_traced"] for turn in turns) / 1024
+
+    return {
+        "name": args.name,
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "turns", "tools", "docs", "payload_bytes", "tool_delay_ms", "model_latency_ms",
+                "tool_rounds", "tools_per_round", "response_chars", "mentions", "stream", "token_budget",
+            )
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "summary": {key: round(value, 3) if isinstance(value, float) else value for key, value in summary.items()},
+        "spans": {
+            name: {
+                "count": s["count"],
+                "errors": s["errors"],
+                "p50_ms": round(s["p50_ms"], 3),
+                "p95_ms": round(s["p95_ms"], 3),
+            }
+            for name, s in tracer.stats().items()
+        },
+    }
+
+def compare(result: dict, baseline: dict, threshold: float) -> list[str]:
+    """Prints each summary metric next to the baseline and returns the ones that regressed."""
+    regressions = []
+    for key, value in result["summary"].items():
+        old = baseline.get("summary", {}).get(key)
+        if value is None or old is None:
+            continue
+        change = (value - old) / old if old else 0.0
+        regressed = key in LOWER_IS_BETTER and change > threshold
+        if regressed:
+            regressions.append(key)
+        print(f"{key:<26} {old:>12.3f} -> {value:>12.3f}  {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--name", default="latest", help="name of the result file in bench/results")
+    parser.add_argument("--output", help="write results to this path instead")
+    parser.add_argument("--compare", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change reported as a regression")
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--tools", type=int, default=10)
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--payload-bytes", type=int, default=2048)
+    parser.add_argument("--tool-delay-ms", type=float, default=0.0)
+    parser.add_argument("--model-latency-ms", type=float, default=50.0)
+    parser.add_argument("--tool-rounds", type=int, default=1)
+    parser.add_argument("--tools-per-round", type=int, default=2)
+    parser.add_argument("--response-chars", type=int, default=400)
+    parser.add_argument("--mentions", type=int, default=1, help="documents @-mentioned per query")
+    parser.add_argument("--token-budget", type=int, default=100_000)
+    parser.add_argument("--no-stream", dest="stream", action="store_false")
+    parser.add_argument("--trace-memory", action="store_true", help="track peak allocations with tracemalloc (slower)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    result = asyncio.run(run_benchmark(args))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.name}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+    print(json.dumps(result["summary"], indent=2, sort_keys=True))
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Synthetic MCP server for benchmarks.
+
+Serves the same resources and prompt as the document server, plus a
+configurable number of read-only tools, over generated documents:
+
+    python -m bench.synthetic_server --tools 20 --docs 200 --payload-bytes 4096 --tool-delay-ms 5
+"""
+import argparse
+import asyncio
+import logging
+from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp.prompts import base
+from mcp.types import ToolAnnotations
+from pydantic import Field
+
+def make_document(index: int, size: int) -> str:
+    sentence = f"Document {index} discusses topic {index % 17} in detail. "
+    return (sentence * (size // len(sentence) + 1))[:size]
+
+def build_server(tools: int, docs: int, payload_bytes: int, tool_delay_ms: float) -> FastMCP:
+    mcp = FastMCP(name="Synthetic MCP", log_level="ERROR")
+    documents = {f"doc_{i}.md": make_document(i, payload_bytes) for i in range(docs)}
+
+    @mcp.tool(
+        name="read_doc_contents",
+        description="Read the contents of a document and return it as a string.",
+        annotations=ToolAnnotations(readOnlyHint=True),
+    )
+    async def read_document(doc_id: str):
+        await asyncio.sleep(tool_delay_ms / 1000)
+        if doc_id not in documents:
+            raise ValueError(f"Document with id '{doc_id}' not found.")
+        return documents[doc_id]
+
+    def add_tool(index: int):
+        # every tool returns `payload_bytes` of text after `tool_delay_ms`
+        @mcp.tool(
+            name=f"tool_{index}",
+            description=f"Synthetic tool number {index}. Returns a payload for the given key.",
+            annotations=ToolAnnotations(readOnlyHint=index % 2 == 0),
+        )
+        async def tool(key: str = "") -> str:
+            await asyncio.sleep(tool_delay_ms / 1000)
+            return make_document(index, payload_bytes)
+
+    for index in range(tools):
+        add_tool(index)
+
+    @mcp.resource(uri="docs://documents", mime_type="application/json")
+    def list_docs() -> list[str]:
+        return list(documents)
+
+    @mcp.resource(uri="docs://documents/{doc_id}", mime_type="text/plain")
+    def fetch_doc(doc_id: str):
+        if doc_id not in documents:
+            raise ValueError(f"Document with id '{doc_id}' not found.")
+        return documents[doc_id]
+
+    @mcp.prompt(name="format_document", description="Rewrite the contents of the document in markdown format.")
+    def format_document(doc_id: str = Field()) -> list[base.Message]:
+        return [base.UserMessage(f"Reformat the document {doc_id} as markdown.")]
+
+    return mcp
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tools", type=int, default=10)
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--payload-bytes", type=int, default=2048)
+    parser.add_argument("--tool-delay-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    build_server(args.tools, args.docs, args.payload_bytes, args.tool_delay_ms).run(transport="stdio")
+
+if __name__ == "__main__":
+    main()
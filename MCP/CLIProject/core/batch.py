@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+import time
+from typing import TextIO
+from mcp_client import MCP_Client
+from core.claude import Claude
+from core.cli_chat import CliChat
+from core.tools import ToolCatalog
+from core.telemetry import tracer, percentile
+
+logger = logging.getLogger(__name__)
+
+class BatchRunner:
+    """Runs queries from a JSONL file without the interactive prompt.
+
+    Each input line is an object with a "query", which may contain
+    @-mentions or start with a /command, and an optional "id". Every query
+    gets its own CliChat, so queries don't share a conversation, but all the
+    chats share the MCP clients and one tool catalog. At most `concurrency`
+    queries run at a time, and input is only read as slots free up, so a
+    large file is never held in memory. Results are written as JSONL in the
+    order they complete.
+    """
+
+    def __init__(
+            self,
+            doc_client: MCP_Client,
+            clients: dict[str, MCP_Client],
+            claude_service: Claude,
+            concurrency: int = 4,
+            token_budget: int = 100_000,
+    ):
+        self.doc_client = doc_client
+        self.clients = clients
+        self.claude_service = claude_service
+        self.concurrency = max(1, concurrency)
+        self.token_budget = token_budget
+        self.tool_catalog = ToolCatalog(clients)
+        self.latencies: list[float] = []
+        self.succeeded = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    async def _run_query(self, index: int, line: str) -> dict:
+        result = {"index": index, "id": None, "response": None, "error": None}
+        started = time.perf_counter()
+        try:
+            with tracer.span("batch.query", index=index):
+                item = json.loads(line)
+                if isinstance(item, str):
+                    item = {"query": item}
+                result["id"] = item.get("id")
+                if not item.get("query"):
+                    raise ValueError("Input line has no 'query'")
+
+                chat = CliChat(
+                    doc_client=self.doc_client,
+                    clients=self.clients,
+                    claude_service=self.claude_service,
+                    token_budget=self.token_budget,
+                    tool_catalog=self.tool_catalog,
+                )
+                # streamed without a handler, so nothing is printed along the way
+                result["response"] = await chat.run(item["query"], stream=True)
+            self.succeeded += 1
+        except Exception as e:
+            logger.warning(f"Batch query {index} failed: {e!r}")
+            result["error"] = str(e) or repr(e)
+            self.failed += 1
+
+        latency = time.perf_counter() - started
+        self.latencies.append(latency)
+        result["latency_ms"] = round(latency * 1000, 1)
+        return result
+
+    async def run(self, source: TextIO, sink: TextIO):
+        """Runs every query in `source` and writes one result line per query to `sink`."""
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks: set[asyncio.Task] = set()
+
+        async def run_one(index: int, line: str):
+            try:
+                result = await self._run_query(index, line)
+                sink.write(json.dumps(result) + "\n")
+                sink.flush()
+            finally:
+                slots.release()
+
+        started = time.perf_counter()
+        index = 0
+        while True:
+            await slots.acquire()
+            # reading in a thread keeps the loop free while waiting on a slow pipe
+            line = await asyncio.to_thread(source.readline)
+            if not line:
+                slots.release()
+                break
+            if not line.strip():
+                slots.release()
+                continue
+
+            task = asyncio.create_task(run_one(index, line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            index += 1
+
+        await asyncio.gather(*tasks)
+        self.elapsed = time.perf_counter() - started
+
+    def report(self) -> str:
+        """Summarizes throughput, latency and errors of the run."""
+        total = self.succeeded + self.failed
+        if total == 0:
+            return "No queries run."
+
+        latencies = sorted(self.latencies)
+        return (
+            f"{total} queries in {self.elapsed:.1f}s ({total / self.elapsed if self.elapsed else 0:.2f}/s), "
+            f"{self.failed} failed ({self.failed / total:.1%})\n"
+            f"latency p50 {percentile(latencies, 50) * 1000:.0f} ms, p95 {percentile(latencies, 95) * 1000:.0f} ms, "
+            f"p99 {percentile(latencies, 99) * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms"
+        )
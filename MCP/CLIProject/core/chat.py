@@ -1,37 +1,81 @@
+from __future__ import annotations
 from core.claude import Claude
 from mcp_client import MCP_Client
-from anthropic.types import MessageParam
-from core.tools import ToolManager
+from core.tools import ToolManager, ToolCatalog
+from core.history import HistoryManager, render_messages
+from core.telemetry import tracer
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from anthropic.types import MessageParam
 
 class Chat:
-    def __init__(self, claude_service: Claude, clients: dict[str, MCP_Client]):
+    def __init__(
+            self,
+            claude_service: Claude,
+            clients: dict[str, MCP_Client],
+            token_budget: int = 100_000,
+            tool_catalog: Optional[ToolCatalog] = None,
+    ):
         self.claude_service: Claude = claude_service
         self.clients: dict[str, MCP_Client] = clients
         self.messages: list[MessageParam] = []
+        # chats over the same clients can share one catalog instead of each listing the tools
+        self.tool_catalog: ToolCatalog = tool_catalog or ToolCatalog(clients)
+        self.history: HistoryManager = HistoryManager(token_budget=token_budget, summarizer=self._summarize)
+
+    async def _summarize(self, messages: list[MessageParam]) -> str:
+        """Asks the model for a short summary of earlier turns, used when compacting the history."""
+        prompt = f"""
+        Summarize the conversation below so it can replace the original turns in a chat history.
+        Keep the user's goals, decisions, document ids and any facts needed to continue the conversation.
+        Be concise.
+
+        <conversation>
+        {render_messages(messages)}
+        </conversation>
+        """
+        response = await self.claude_service.chat(messages=[{"role": "user", "content": prompt}])
+        return self.claude_service.text_from_message(response)
 
     async def _process_query(self, query: str):
         self.messages.append({"role": "user", "content": query})
 
-    async def run(self, query: str) -> str:
+    async def run(self, query: str, stream: bool = False, on_event=None) -> str:
         final_text_response = ""
 
-        await self._process_query(query)
+        with tracer.span("chat.turn") as turn:
+            await self._process_query(query)
+
+            model_calls = 0
+            while True:
+                with tracer.span("chat.compact_history") as span:
+                    span.attributes["compacted"] = await self.history.compact(self.messages)
+
+                model_calls += 1
+                if stream:
+                    response = await self.claude_service.chat_stream(
+                        messages=self.messages,
+                        tools=await ToolManager.get_all_tools(self.tool_catalog),
+                        on_event=on_event,
+                    )
+                else:
+                    response = await self.claude_service.chat(
+                        messages=self.messages,
+                        tools=await ToolManager.get_all_tools(self.tool_catalog),
+                    )
 
-        while True:
-            response = self.claude_service.chat(
-                messages=self.messages,
-                tools=await ToolManager.get_all_tools(self.clients),
-            )
+                self.claude_service.add_assistant_message(self.messages, response)
 
-            self.claude_service.add_assistant_message(self.messages, response)
+                if response.stop_reason == "tool_use":
+                    if not stream:
+                        print(self.claude_service.text_from_message(response))
+                    tool_result_parts = await ToolManager.execute_tool_requests(catalog=self.tool_catalog, message=response)
+                    self.claude_service.add_user_message(self.messages, tool_result_parts)
+                else:
+                    final_text_response = self.claude_service.text_from_message(response)
+                    break
 
-            if response.stop_reason == "tool_use":
-                print(self.claude_service.text_from_message(response))
-                tool_result_parts = await ToolManager.execute_tool_requests(clients=self.clients, message=response)
-                self.claude_service.add_user_message(self.messages, tool_result_parts)
-            else:
-                final_text_response = self.claude_service.text_from_message(response)
-                break
+            turn.attributes["model_calls"] = model_calls
 
         return final_text_response
-    
\ No newline at end of file
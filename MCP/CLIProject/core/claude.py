@@ -1,12 +1,119 @@
-from anthropic import Anthropic
-from anthropic.types import Message
+from __future__ import annotations
+import logging
+from typing import TYPE_CHECKING, Optional
+from core.telemetry import tracer, payload_bytes
+
+# anthropic takes a while to import, so it is only loaded for the first request
+if TYPE_CHECKING:
+    from anthropic import AsyncAnthropic
+    from anthropic.types import Message
+
+logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = {"type": "ephemeral"}
+# the API accepts at most 4 cache breakpoints per request
+MAX_CACHE_BREAKPOINTS = 4
+
+def _with_cache_control(content) -> list | None:
+    """Returns a copy of a user message's content with a breakpoint on its last block."""
+    if isinstance(content, str):
+        return [{"type": "text", "text": content, "cache_control": CACHE_CONTROL}] if content else None
+
+    if content and isinstance(content[-1], dict):
+        return [*content[:-1], {**content[-1], "cache_control": CACHE_CONTROL}]
+
+    return None
+
+def add_cache_breakpoints(params: dict) -> dict:
+    """Marks the tools, the system prompt and the conversation prefix as cacheable.
+
+    Breakpoints go on the last tool, the system prompt and the last two user
+    messages: the newest one writes the prefix for the next agent-loop
+    iteration and the one before it reads the prefix written by the previous
+    call. The caller's message list is left untouched.
+    """
+    params = dict(params)
+    breakpoints = 0
+
+    if params.get("tools"):
+        params["tools"] = [*params["tools"][:-1], {**params["tools"][-1], "cache_control": CACHE_CONTROL}]
+        breakpoints += 1
+
+    system = params.get("system")
+    if isinstance(system, str) and system:
+        params["system"] = [{"type": "text", "text": system, "cache_control": CACHE_CONTROL}]
+        breakpoints += 1
+
+    messages = list(params["messages"])
+    message_breakpoints = min(2, MAX_CACHE_BREAKPOINTS - breakpoints)
+    for i in range(len(messages) - 1, -1, -1):
+        if message_breakpoints == 0:
+            break
+        message = messages[i]
+        if message["role"] != "user":
+            continue
+        content = _with_cache_control(message["content"])
+        if content is not None:
+            messages[i] = {**message, "content": content}
+            message_breakpoints -= 1
+    params["messages"] = messages
+
+    return params
 
 class Claude:
-    def __init__(self, model: str):
-        self.client = Anthropic()
+    def __init__(self, model: str, prompt_caching: bool = True):
+        self._client: Optional[AsyncAnthropic] = None
         self.model = model
+        self.prompt_caching = prompt_caching
+        self.usage = {
+            "calls": 0,
+            "input_tokens": 0,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+            "output_tokens": 0,
+        }
+
+    @property
+    def client(self) -> AsyncAnthropic:
+        if self._client is None:
+            from anthropic import AsyncAnthropic
+            self._client = AsyncAnthropic()
+        return self._client
+
+    def _record_usage(self, message: Message) -> dict[str, int]:
+        """Adds the usage of one response to the totals and returns it."""
+        usage = message.usage
+        self.usage["calls"] += 1
+        call_usage = {
+            key: getattr(usage, key, None) or 0
+            for key in ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens")
+        }
+        for key, value in call_usage.items():
+            self.usage[key] += value
+        logger.debug(
+            f"Usage: {usage.input_tokens} uncached, {usage.cache_creation_input_tokens or 0} cache write, "
+            f"{usage.cache_read_input_tokens or 0} cache read, {usage.output_tokens} output tokens"
+        )
+        return call_usage
+
+    def cache_hit_rate(self) -> float:
+        """Share of input tokens served from the prompt cache so far."""
+        total = (
+            self.usage["input_tokens"]
+            + self.usage["cache_creation_input_tokens"]
+            + self.usage["cache_read_input_tokens"]
+        )
+        return self.usage["cache_read_input_tokens"] / total if total else 0.0
+
+    def usage_report(self) -> str:
+        return (
+            f"{self.usage['calls']} calls, {self.usage['cache_read_input_tokens']} cache read / "
+            f"{self.usage['cache_creation_input_tokens']} cache write / {self.usage['input_tokens']} uncached "
+            f"input tokens, cache hit rate {self.cache_hit_rate():.0%}"
+        )
 
     def add_user_message(self, messages: list, message):
+        from anthropic.types import Message
         user_message = {
             "role": "user",
             "content": message.content if isinstance(message, Message) else message,
@@ -14,6 +121,7 @@ class Claude:
         messages.append(user_message)
 
     def add_assistant_message(self, messages: list, message):
+        from anthropic.types import Message
         assistant_message = {
             "role": "assistant",
             "content": message.content if isinstance(message, Message) else message,
@@ -24,8 +132,8 @@ class Claude:
         return "\n".join(
             [block.text for block in message.content if block.type == "text"]
         )
-    
-    def chat(
+
+    def _build_params(
             self,
             messages,
             system=None,
@@ -34,7 +142,7 @@ class Claude:
             tools=None,
             thinking=False,
             thinking_budget=1024,
-    ) -> Message:
+    ) -> dict:
         params = {
             "model": self.model,
             "max_tokens": 8000,
@@ -55,6 +163,73 @@ class Claude:
         if system:
             params["system"] = system
 
-        response = self.client.messages.create(**params)
+        if self.prompt_caching:
+            params = add_cache_breakpoints(params)
+
+        return params
+
+    async def chat(
+            self,
+            messages,
+            system=None,
+            temperature=1.0,
+            stop_sequences=[],
+            tools=None,
+            thinking=False,
+            thinking_budget=1024,
+    ) -> Message:
+        params = self._build_params(
+            messages=messages,
+            system=system,
+            temperature=temperature,
+            stop_sequences=stop_sequences,
+            tools=tools,
+            thinking=thinking,
+            thinking_budget=thinking_budget,
+        )
+
+        with tracer.span("claude.chat", model=self.model) as span:
+            if tracer.enabled:
+                span.attributes["request_bytes"] = payload_bytes(params)
+            response = await self.client.messages.create(**params)
+            span.attributes.update(self._record_usage(response))
+            span.attributes["stop_reason"] = response.stop_reason
+
+        return response
+
+    async def chat_stream(
+            self,
+            messages,
+            system=None,
+            temperature=1.0,
+            stop_sequences=[],
+            tools=None,
+            thinking=False,
+            thinking_budget=1024,
+            on_event=None,
+    ) -> Message:
+        """Streams a response, awaiting `on_event` for every stream event as it arrives."""
+        params = self._build_params(
+            messages=messages,
+            system=system,
+            temperature=temperature,
+            stop_sequences=stop_sequences,
+            tools=tools,
+            thinking=thinking,
+            thinking_budget=thinking_budget,
+        )
+
+        with tracer.span("claude.chat_stream", model=self.model) as span:
+            if tracer.enabled:
+                span.attributes["request_bytes"] = payload_bytes(params)
+            async with self.client.messages.stream(**params) as stream:
+                async for event in stream:
+                    if on_event:
+                        await on_event(event)
+
+                response = await stream.get_final_message()
+
+            span.attributes.update(self._record_usage(response))
+            span.attributes["stop_reason"] = response.stop_reason
 
-        return response
\ No newline at end of file
+        return response
@@ -4,10 +4,18 @@ from typing import List, Optional
 from prompt_toolkit.document import Document
 from prompt_toolkit.completion import Completer, Completion
 from core.cli_chat import CliChat
+from mcp.types import Prompt
+from core.telemetry import tracer
 from prompt_toolkit.key_binding import KeyBindings
 from prompt_toolkit.history import InMemoryHistory
 from prompt_toolkit import PromptSession
 from prompt_toolkit.styles import Style
+from bisect import bisect_left, bisect_right
+
+# commands handled by the CLI itself instead of a server prompt
+BUILTIN_COMMANDS = {
+    "stats": "Show latency percentiles per span. Also: /stats export <file.json>, /stats reset",
+}
 
 class CommandAutoSuggest(AutoSuggest):
     def __init__(self, prompts: List):
@@ -32,11 +40,95 @@ class CommandAutoSuggest(AutoSuggest):
 
         return None
     
+class CompletionIndex:
+    """Case-insensitive lookup over a fixed list of names, built once per update.
+
+    Prefix matches come from a sorted array with bisect. Substring matches scan
+    one newline-joined string with str.find. Fuzzy (in-order subsequence)
+    matches skip names that lack one of the query's characters, then walk
+    each remaining name once, so a query never costs more than one pass over
+    the names. Every query stops after `limit` results.
+    """
+
+    def __init__(self, names: List[str] = ()):
+        self.names = list(dict.fromkeys(names))
+        keys = [name.lower() for name in self.names]
+        self._keys = keys
+        self._charsets = [frozenset(key) for key in keys]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._sorted_keys = [keys[i] for i in order]
+        self._sorted_names = [self.names[i] for i in order]
+        self._joined = "\n".join(keys)
+        # offset of each name in the joined string, to map a match back to its name
+        self._starts = []
+        offset = 0
+        for key in keys:
+            self._starts.append(offset)
+            offset += len(key) + 1
+
+    def _name_at(self, pos: int) -> str:
+        return self.names[bisect_right(self._starts, pos) - 1]
+
+    def _next_start(self, pos: int) -> int:
+        """Offset of the name after the one at `pos`, so a name is matched only once."""
+        index = bisect_right(self._starts, pos)
+        return self._starts[index] if index < len(self._starts) else len(self._joined)
+
+    def prefix(self, prefix: str, limit: int) -> List[str]:
+        key = prefix.lower()
+        lo = bisect_left(self._sorted_keys, key)
+        hi = bisect_left(self._sorted_keys, key + "\U0010ffff", lo)
+        return self._sorted_names[lo:min(hi, lo + limit)]
+
+    def substring(self, text: str, limit: int) -> List[str]:
+        key = text.lower()
+        found = []
+        pos = self._joined.find(key)
+        while pos != -1 and len(found) < limit:
+            name = self._name_at(pos)
+            found.append(name)
+            # continue after the end of this name
+            pos = self._joined.find(key, self._next_start(pos))
+        return found
+
+    def fuzzy(self, text: str, limit: int) -> List[str]:
+        query = text.lower()
+        needed = frozenset(query)
+        found = []
+        for name, key, charset in zip(self.names, self._keys, self._charsets):
+            if not needed <= charset:
+                continue
+            # `c in chars` consumes the iterator, so the characters must appear in order
+            chars = iter(key)
+            if all(c in chars for c in query):
+                found.append(name)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def search(self, text: str, limit: int = 50) -> List[str]:
+        """Prefix matches first, then substring matches, then fuzzy matches."""
+        if not text:
+            return self._sorted_names[:limit]
+
+        results = dict.fromkeys(self.prefix(text, limit))
+        for finder in (self.substring, self.fuzzy):
+            if len(results) >= limit:
+                break
+            # later finders also return the earlier matches, so ask for enough to fill the rest
+            for name in finder(text, limit + len(results)):
+                results.setdefault(name)
+                if len(results) >= limit:
+                    break
+        return list(results)
+
 class UnifiedCompleter(Completer):
-    def __init__(self):
+    def __init__(self, max_results: int = 50):
+        self.max_results = max_results
         self.prompts = []
         self.prompt_dict = {}
         self.resources = []
+        self.resource_index = CompletionIndex()
 
     def update_prompts(self, prompts: List):
         self.prompts = prompts
@@ -44,6 +136,7 @@ class UnifiedCompleter(Completer):
 
     def update_resources(self, resources: List):
         self.resources = resources
+        self.resource_index = CompletionIndex(resources)
 
     def get_completions(self, document: Document, complete_event):
         text = document.text
@@ -53,14 +146,13 @@ class UnifiedCompleter(Completer):
             last_at_pos = text_before_cursor.rfind("@")
             prefix = text_before_cursor[last_at_pos + 1:]
 
-            for resource_id in self.resources:
-                if resource_id.lower().startswith(prefix.lower()):
-                    yield Completion(
-                        resource_id,
-                        start_position=-len(prefix),
-                        display=resource_id,
-                        display_meta="Resource",
-                    )
+            for resource_id in self.resource_index.search(prefix, self.max_results):
+                yield Completion(
+                    resource_id,
+                    start_position=-len(prefix),
+                    display=resource_id,
+                    display_meta="Resource",
+                )
 
             return
         
@@ -78,12 +170,20 @@ class UnifiedCompleter(Completer):
                             display=prompt.name,
                             display_meta=prompt.description,
                         )
+                for name, description in BUILTIN_COMMANDS.items():
+                    if name.startswith(cmd_prefix):
+                        yield Completion(
+                            name,
+                            start_position=-len(cmd_prefix),
+                            display=name,
+                            display_meta=description,
+                        )
                 return
             
             if len(parts) == 1 and text.endswith(' '):
                 cmd = parts[0]
                 if cmd in self.prompt_dict:
-                    for id in self.resources:
+                    for id in self.resource_index.search("", self.max_results):
                         yield Completion(
                             id,
                             start_position=0,
@@ -94,13 +194,12 @@ class UnifiedCompleter(Completer):
             
             if len(parts) >= 2:
                 doc_prefix = parts[-1]
-                for resource in self.resources:
-                    if 'id' in resource and resource['id'].lower().startswith(doc_prefix.lower()):
-                        yield Completion(
-                            resource['id'],
-                            start_position=-len(doc_prefix),
-                            display=resource['id']
-                        )
+                for resource_id in self.resource_index.search(doc_prefix, self.max_results):
+                    yield Completion(
+                        resource_id,
+                        start_position=-len(doc_prefix),
+                        display=resource_id,
+                    )
                 return
             
 class CliApp:
@@ -160,28 +259,60 @@ class CliApp:
             )
         )
     
+    def _set_resources(self, resources: List[str]):
+        self.resources = resources
+        self.completer.update_resources(self.resources)
+
+    def _set_prompts(self, prompts: List[Prompt]):
+        self.prompts = prompts
+        self.completer.update_prompts(self.prompts)
+        self.command_auto_suggester.prompts = self.prompts
+        self.session.auto_suggest = self.command_auto_suggester
+
     async def refresh_resources(self):
         """Refreshes the list of resources"""
         try:
-            self.resources = await self.agent.list_docs_ids()
-            self.completer.update_resources(self.resources)
+            self._set_resources(await self.agent.list_docs_ids())
         except Exception as e:
             print(f"Error refreshing resources: {e}")
 
     async def refresh_prompts(self):
         """Refreshes the list of prompts"""
         try:
-            self.prompts = await self.agent.list_prompts()
-            self.completer.update_prompts(self.prompts)
-            self.command_auto_suggester.prompts = self.prompts
-            self.session.auto_suggest = self.command_auto_suggester
+            self._set_prompts(await self.agent.list_prompts())
         except Exception as e:
             print(f"Error refreshing prompts: {e}")
 
+    def load_snapshot(self, snapshot: dict):
+        """Fills the completions and tool catalog from a snapshot of an earlier run."""
+        self._set_resources(snapshot["resources"])
+        self._set_prompts([Prompt.model_validate(prompt) for prompt in snapshot["prompts"]])
+        self.agent.tool_catalog.load_snapshot(snapshot["tools"])
+
     async def initialize(self):
         await self.refresh_resources()
         await self.refresh_prompts()
 
+    async def _handle_stream_event(self, event):
+        """Renders streamed text as soon as it arrives and announces tool calls."""
+        if event.type == "content_block_delta" and event.delta.type == "text_delta":
+            print(event.delta.text, end="", flush=True)
+        elif event.type == "content_block_start" and event.content_block.type == "tool_use":
+            print(f"\n[Calling tool: {event.content_block.name}]", flush=True)
+
+    def _handle_stats_command(self, args: List[str]):
+        """Prints the span stats, or exports or resets them."""
+        if args[:1] == ["export"] and len(args) == 2:
+            tracer.export_otel(args[1])
+            print(f"Exported spans to {args[1]}")
+        elif args == ["reset"]:
+            tracer.reset()
+            print("Stats reset.")
+        elif not args:
+            print(tracer.report())
+        else:
+            print("Usage: /stats [export <file.json> | reset]")
+
     async def run(self):
         """Runs the CLI application"""
         # await self.initialize()
@@ -190,9 +321,15 @@ class CliApp:
                 user_input = await self.session.prompt_async('> ')
                 if not user_input.strip():
                     continue
+
+                words = user_input.split()
+                if words[0] == "/stats":
+                    self._handle_stats_command(words[1:])
+                    continue
                 
-                response = await self.agent.run(user_input)
-                print(f"\nResponse: \n{response}\n")
+                print("\nResponse: ")
+                await self.agent.run(user_input, stream=True, on_event=self._handle_stream_event)
+                print("\n")
 
             except KeyboardInterrupt:
                 print("\nExiting CLI application.")
@@ -1,13 +1,25 @@
+from __future__ import annotations
 from core.chat import Chat
 from mcp_client import MCP_Client
 from core.claude import Claude
+from core.tools import ToolCatalog
 from mcp.types import Prompt, PromptMessage
-from typing import Tuple, List
-from anthropic.types import MessageParam
+from typing import TYPE_CHECKING, AsyncIterator, Tuple, List, Optional
+from core.telemetry import tracer, payload_bytes
+
+if TYPE_CHECKING:
+    from anthropic.types import MessageParam
 
 class CliChat(Chat):
-    def __init__(self, doc_client: MCP_Client, clients: dict[str, MCP_Client], claude_service: Claude):
-        super().__init__(claude_service=claude_service, clients=clients)
+    def __init__(
+            self,
+            doc_client: MCP_Client,
+            clients: dict[str, MCP_Client],
+            claude_service: Claude,
+            token_budget: int = 100_000,
+            tool_catalog: Optional[ToolCatalog] = None,
+    ):
+        super().__init__(claude_service=claude_service, clients=clients, token_budget=token_budget, tool_catalog=tool_catalog)
         self.doc_client: MCP_Client = doc_client
 
     async def list_prompts(self) -> List[Prompt]:
@@ -22,24 +34,40 @@ class CliChat(Chat):
         """Retrieves the content of a specific document by its ID."""
         return await self.doc_client.read_resource(f"docs://documents/{doc_id}")
     
+    async def get_doc_lines(self, doc_id: str, start_line: int, end_line: int) -> str:
+        """Retrieves the lines start_line to end_line (1-based, inclusive) of a document."""
+        return await self.doc_client.read_resource(f"docs://documents/{doc_id}/lines/{start_line}/{end_line}")
+
+    async def iter_doc_chunks(self, doc_id: str) -> AsyncIterator[str]:
+        """Yields the content of a document chunk by chunk, without holding all of it at once."""
+        async for chunk in self.doc_client.read_resource_chunks(f"docs://documents/{doc_id}"):
+            yield chunk
+
     async def get_prompt(self, command: str, doc_id: str) -> List[PromptMessage]:
         """Retrieves a specific prompt based on the command and document ID."""
         return await self.doc_client.get_prompt(command, {"doc_id": doc_id})
     
     async def _extract_resources(self, query: str) -> str:
         """Extracts document resources mentioned in the query."""
-        mentions = [word[-1] for word in query.split() if word.startswith("@")]
-        doc_ids = await self.list_docs_ids()
-        mentioned_docs: List[Tuple[str, str]] = []
-        for doc_id in doc_ids:
-            if doc_id in mentions:
-                content = await self.get_doc_content(doc_id)
-                mentioned_docs.append((doc_id, content))
+        mentions = [word[1:] for word in query.split() if word.startswith("@")]
+        if not mentions:
+            return ""
 
-        return "".join(
-            f'\n<document id="{doc_id}>\n{content}\n</document>\n'
-            for doc_id, content in mentioned_docs
-        )
+        with tracer.span("chat.extract_resources") as span:
+            doc_ids = set(await self.list_docs_ids())
+            mentioned_ids = [doc_id for doc_id in dict.fromkeys(mentions) if doc_id in doc_ids]
+            contents = await self.doc_client.read_resources(
+                [f"docs://documents/{doc_id}" for doc_id in mentioned_ids]
+            )
+            mentioned_docs: List[Tuple[str, str]] = list(zip(mentioned_ids, contents))
+
+            resources = "".join(
+                f'\n<document id="{doc_id}">\n{content}\n</document>\n'
+                for doc_id, content in mentioned_docs
+            )
+            span.attributes["documents"] = len(mentioned_docs)
+            span.attributes["payload_bytes"] = len(resources)
+        return resources
     
     async def _process_command(self, query: str) -> bool:
         """Processes commands in the query that start with a slash."""
@@ -56,6 +84,12 @@ class CliChat(Chat):
     
     async def _process_query(self, query: str):
         """Processes the user query, extracting resources and handling commands."""
+        with tracer.span("chat.process_query") as span:
+            first_new = len(self.messages)
+            await self._build_query_message(query)
+            span.attributes["prompt_bytes"] = payload_bytes(self.messages[first_new:])
+
+    async def _build_query_message(self, query: str):
         if await self._process_command(query):
             return
         
@@ -0,0 +1,236 @@
+import sqlite3
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Iterable, Optional
+from core.piece_table import PieceTable
+
+DEFAULT_DOCS = {
+    "deposition.md": "This deposition covers the testimony of Angela Smith, P.E.",
+    "report.pdf": "The report details the state of a 20m condenser tower.",
+    "financials.docx": "These financials outline the project's budget and expenditures.",
+    "outlook.pdf": "This document presents the projected future performance of the system.",
+    "plan.md": "The plan outlines the steps for the project's implementation.",
+    "spec.txt": "These specifications define the technical requirements for the equipment.",
+}
+
+# (text, offset of the text, end offset of the requested lines, length of the document)
+LineRegion = tuple[str, int, int, int]
+
+def line_range(content: str, start_line: int, end_line: Optional[int] = None) -> tuple[int, int]:
+    """Returns the [start, end) offsets of lines start_line..end_line of a string, like PieceTable.line_range."""
+    if start_line < 1:
+        raise ValueError(f"Line numbers start at 1, got {start_line}")
+    if end_line is not None and end_line < start_line:
+        raise ValueError(f"end_line ({end_line}) is before start_line ({start_line})")
+
+    start = 0
+    for _ in range(start_line - 1):
+        start = content.find("\n", start) + 1
+        if start == 0:
+            raise ValueError(f"Line {start_line} is past the end of the document")
+    if end_line is None:
+        return start, len(content)
+
+    end = start - 1
+    for _ in range(end_line - start_line + 1):
+        end = content.find("\n", end + 1)
+        if end == -1:
+            return start, len(content)
+    return start, end
+
+def _read_table_lines(table: PieceTable, start_line: int, end_line: Optional[int], limit: Optional[int]) -> LineRegion:
+    start, end = table.line_range(start_line, end_line if end_line is not None else table.line_count())
+    return table.text()[start:end if limit is None else min(end, start + limit)], start, end, len(table)
+
+class DocumentStore(ABC):
+    """Storage backend for the documents served by the Document MCP server."""
+
+    @abstractmethod
+    def get(self, doc_id: str) -> Optional[str]:
+        """Returns the content of a document, or None if it does not exist."""
+
+    @abstractmethod
+    def put(self, doc_id: str, content: str):
+        """Creates or replaces a document."""
+
+    @abstractmethod
+    def ids(self) -> list[str]:
+        """Returns the ids of all documents."""
+
+    def read(self, doc_id: str, offset: int = 0, limit: Optional[int] = None) -> Optional[tuple[str, int]]:
+        """Returns up to `limit` characters from `offset` and the document's length, or None if it does not exist."""
+        content = self.get(doc_id)
+        if content is None:
+            return None
+        end = len(content) if limit is None else offset + limit
+        return content[offset:end], len(content)
+
+    def read_lines(
+            self, doc_id: str, start_line: int, end_line: Optional[int] = None, limit: Optional[int] = None,
+    ) -> Optional[LineRegion]:
+        """Returns lines `start_line` to `end_line` (1-based, inclusive, to the end by default) cut off at
+        `limit` characters, where they start and end and the document's length, or None if it does not exist."""
+        content = self.get(doc_id)
+        if content is None:
+            return None
+        start, end = line_range(content, start_line, end_line)
+        return content[start:end if limit is None else min(end, start + limit)], start, end, len(content)
+
+    def open(self, doc_id: str) -> Optional[PieceTable]:
+        """Returns an editable view of a document, or None if it does not exist."""
+        content = self.get(doc_id)
+        return PieceTable(content) if content is not None else None
+
+    def save(self, doc_id: str, table: PieceTable):
+        """Stores a document edited through `open`."""
+        self.put(doc_id, table.text())
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self.get(doc_id) is not None
+
+    def seed(self, docs: dict[str, str]):
+        """Adds the given documents if the store is empty."""
+        if not self.ids():
+            for doc_id, content in docs.items():
+                self.put(doc_id, content)
+
+    def close(self):
+        pass
+
+class MemoryDocumentStore(DocumentStore):
+    """Keeps every document in memory as a piece table. Edits are lost when the server stops."""
+
+    def __init__(self):
+        self._docs: dict[str, PieceTable] = {}
+
+    def get(self, doc_id: str) -> Optional[str]:
+        table = self._docs.get(doc_id)
+        return table.text() if table is not None else None
+
+    def put(self, doc_id: str, content: str):
+        self._docs[doc_id] = PieceTable(content)
+
+    def ids(self) -> list[str]:
+        return list(self._docs.keys())
+
+    def read_lines(
+            self, doc_id: str, start_line: int, end_line: Optional[int] = None, limit: Optional[int] = None,
+    ) -> Optional[LineRegion]:
+        table = self._docs.get(doc_id)
+        return _read_table_lines(table, start_line, end_line, limit) if table is not None else None
+
+    def open(self, doc_id: str) -> Optional[PieceTable]:
+        return self._docs.get(doc_id)
+
+    def save(self, doc_id: str, table: PieceTable):
+        # `open` hands out the stored table itself, so edits are already in place
+        self._docs[doc_id] = table
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+class SQLiteDocumentStore(DocumentStore):
+    """Keeps documents in a SQLite file, looked up by primary key.
+
+    Opening the store does not read any documents, so startup time does not
+    depend on the corpus size, and memory is bounded by SQLite's page cache
+    (`cache_size_kb`) rather than by the number of documents.
+    """
+
+    def __init__(self, path: str, cache_size_kb: int = 64 * 1024, max_open_documents: int = 32):
+        self.path = path
+        self.max_open_documents = max_open_documents
+        # recently edited documents, so a run of edits only parses the text once
+        self._open: OrderedDict[str, PieceTable] = OrderedDict()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # a negative cache_size is a size in KiB rather than a page count
+        self._conn.execute(f"PRAGMA cache_size=-{int(cache_size_kb)}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, content TEXT NOT NULL) WITHOUT ROWID"
+        )
+
+    def get(self, doc_id: str) -> Optional[str]:
+        if doc_id in self._open:
+            return self._open[doc_id].text()
+        row = self._conn.execute("SELECT content FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, doc_id: str, content: str):
+        self._open.pop(doc_id, None)
+        self._write(doc_id, content)
+
+    def read(self, doc_id: str, offset: int = 0, limit: Optional[int] = None) -> Optional[tuple[str, int]]:
+        if doc_id in self._open:
+            return super().read(doc_id, offset, limit)
+        # substr counts characters like Python does, so only the requested region leaves SQLite
+        row = self._conn.execute(
+            "SELECT substr(content, ?, coalesce(?, length(content))), length(content) FROM documents WHERE id = ?",
+            (offset + 1, limit, doc_id),
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def read_lines(
+            self, doc_id: str, start_line: int, end_line: Optional[int] = None, limit: Optional[int] = None,
+    ) -> Optional[LineRegion]:
+        if doc_id in self._open:
+            return _read_table_lines(self._open[doc_id], start_line, end_line, limit)
+        # a read doesn't go through `open`, so it doesn't push edited documents out of the LRU
+        return super().read_lines(doc_id, start_line, end_line, limit)
+
+    def _write(self, doc_id: str, content: str):
+        self._conn.execute(
+            "INSERT INTO documents (id, content) VALUES (?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET content = excluded.content",
+            (doc_id, content),
+        )
+
+    def open(self, doc_id: str) -> Optional[PieceTable]:
+        table = self._open.get(doc_id)
+        if table is None:
+            table = super().open(doc_id)
+            if table is None:
+                return None
+            self._open[doc_id] = table
+            if len(self._open) > self.max_open_documents:
+                self._open.popitem(last=False)
+        self._open.move_to_end(doc_id)
+        return table
+
+    def save(self, doc_id: str, table: PieceTable):
+        self._write(doc_id, table.text())
+
+    def put_many(self, docs: Iterable[tuple[str, str]]):
+        """Bulk-loads documents in a single transaction."""
+        self._open.clear()
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO documents (id, content) VALUES (?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET content = excluded.content",
+                docs,
+            )
+
+    def ids(self) -> list[str]:
+        return [row[0] for row in self._conn.execute("SELECT id FROM documents ORDER BY id")]
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self._conn.execute("SELECT 1 FROM documents WHERE id = ?", (doc_id,)).fetchone() is not None
+
+    def seed(self, docs: dict[str, str]):
+        if self._conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None:
+            self.put_many(docs.items())
+
+    def close(self):
+        self._conn.close()
+
+def create_document_store(url: str) -> DocumentStore:
+    """Creates a store from a URL such as `memory://` or `sqlite:///path/to/docs.db`."""
+    if url in ("", "memory", "memory://"):
+        return MemoryDocumentStore()
+
+    if url.startswith("sqlite:///"):
+        return SQLiteDocumentStore(url[len("sqlite:///"):])
+
+    raise ValueError(f"Unsupported document store: {url}")
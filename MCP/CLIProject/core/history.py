@@ -0,0 +1,164 @@
+from __future__ import annotations
+import json
+import logging
+import re
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+
+if TYPE_CHECKING:
+    from anthropic.types import MessageParam
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_RE = re.compile(r'(<document id="[^"]*">)\n.*?\n(</document>)', re.DOTALL)
+ELIDED_TOOL_RESULT = "[Earlier tool result removed to save context. Call the tool again if it is needed.]"
+ELIDED_DOCUMENT = "[Document content removed to save context. Read the document again if it is needed.]"
+
+Summarizer = Callable[[list["MessageParam"]], Awaitable[str]]
+
+def _block_value(block, key: str, default=None):
+    return block.get(key, default) if isinstance(block, dict) else getattr(block, key, default)
+
+def render_messages(messages: list[MessageParam]) -> str:
+    """Renders messages as plain text, e.g. to ask the model for a summary."""
+    lines = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            lines.append(f"{message['role']}: {content}")
+            continue
+
+        for block in content:
+            block_type = _block_value(block, "type")
+            if block_type == "text":
+                lines.append(f"{message['role']}: {_block_value(block, 'text', '')}")
+            elif block_type == "tool_use":
+                lines.append(f"tool call: {_block_value(block, 'name')}({json.dumps(_block_value(block, 'input', {}))})")
+            elif block_type == "tool_result":
+                lines.append(f"tool result: {_block_value(block, 'content', '')}")
+    return "\n".join(lines)
+
+class HistoryManager:
+    """Keeps a conversation within a token budget by compacting old turns.
+
+    A turn starts at a user message that is not a tool result. The most
+    recent `keep_recent_turns` turns are never changed. When the estimated
+    size of the history goes over `token_budget`, older turns are compacted
+    in steps until it fits:
+
+    1. tool results are replaced by a short note,
+    2. document bodies injected for @-mentions are replaced by a reference,
+    3. the oldest turns are replaced by a model-written summary, or dropped
+       when no summarizer is set.
+
+    tool_use blocks are kept, so every tool_result still has its tool_use.
+    """
+
+    CHARS_PER_TOKEN = 4
+
+    def __init__(
+            self,
+            token_budget: int = 100_000,
+            keep_recent_turns: int = 2,
+            summarizer: Optional[Summarizer] = None,
+    ):
+        self.token_budget = token_budget
+        # the newest turn holds the pending user message, so it is always kept
+        self.keep_recent_turns = max(1, keep_recent_turns)
+        self.summarizer = summarizer
+        # estimates keyed by message identity; the message is kept so the id stays valid
+        self._sizes: dict[int, tuple[MessageParam, int]] = {}
+
+    def estimate_tokens(self, message: MessageParam) -> int:
+        cached = self._sizes.get(id(message))
+        if cached is not None and cached[0] is message:
+            return cached[1]
+
+        content = message["content"]
+        if isinstance(content, str):
+            chars = len(content)
+        else:
+            chars = len(json.dumps(
+                [block if isinstance(block, dict) else block.model_dump() for block in content],
+                default=str,
+            ))
+        tokens = chars // self.CHARS_PER_TOKEN + 1
+        self._sizes[id(message)] = (message, tokens)
+        return tokens
+
+    def total_tokens(self, messages: list[MessageParam]) -> int:
+        return sum(self.estimate_tokens(message) for message in messages)
+
+    @staticmethod
+    def _is_turn_start(message: MessageParam) -> bool:
+        if message["role"] != "user":
+            return False
+        content = message["content"]
+        return isinstance(content, str) or not any(_block_value(b, "type") == "tool_result" for b in content)
+
+    def _old_turns_end(self, messages: list[MessageParam]) -> int:
+        """Returns the index of the first message in the turns that must be kept as they are."""
+        starts = [i for i, message in enumerate(messages) if self._is_turn_start(message)]
+        if len(starts) <= self.keep_recent_turns:
+            return 0
+        return starts[-self.keep_recent_turns]
+
+    def _replace(self, messages: list[MessageParam], i: int, content):
+        self._sizes.pop(id(messages[i]), None)
+        messages[i] = {**messages[i], "content": content}
+
+    def _elide_tool_results(self, messages: list[MessageParam], end: int):
+        for i in range(end):
+            content = messages[i]["content"]
+            if messages[i]["role"] != "user" or isinstance(content, str):
+                continue
+            if not any(_block_value(b, "type") == "tool_result" and _block_value(b, "content") != ELIDED_TOOL_RESULT for b in content):
+                continue
+            self._replace(messages, i, [
+                {**block, "content": ELIDED_TOOL_RESULT} if _block_value(block, "type") == "tool_result" else block
+                for block in content
+            ])
+
+    def _elide_documents(self, messages: list[MessageParam], end: int):
+        for i in range(end):
+            content = messages[i]["content"]
+            if messages[i]["role"] != "user" or not isinstance(content, str):
+                continue
+            elided = DOCUMENT_RE.sub(lambda m: f"{m.group(1)}\n{ELIDED_DOCUMENT}\n{m.group(2)}", content)
+            if elided != content:
+                self._replace(messages, i, elided)
+
+    async def _summarize_old_turns(self, messages: list[MessageParam], end: int):
+        old_turns = messages[:end]
+        if self.summarizer is not None:
+            summary = await self.summarizer(old_turns)
+            # an assistant reply keeps user/assistant alternation, since the kept turns start with a user message
+            replacement: list[MessageParam] = [
+                {"role": "user", "content": f"Summary of the earlier conversation:\n{summary}"},
+                {"role": "assistant", "content": "Understood."},
+            ]
+        else:
+            replacement = []
+
+        for message in old_turns:
+            self._sizes.pop(id(message), None)
+        messages[:end] = replacement
+
+    async def compact(self, messages: list[MessageParam]) -> bool:
+        """Compacts `messages` in place if it is over budget. Returns True if anything changed."""
+        before = self.total_tokens(messages)
+        if before <= self.token_budget:
+            return False
+
+        end = self._old_turns_end(messages)
+        if end == 0:
+            return False
+
+        for step in (self._elide_tool_results, self._elide_documents):
+            step(messages, end)
+            if self.total_tokens(messages) <= self.token_budget:
+                break
+        else:
+            await self._summarize_old_turns(messages, end)
+
+        logger.info(f"Compacted conversation history from ~{before} to ~{self.total_tokens(messages)} tokens")
+        return True
@@ -0,0 +1,176 @@
+from bisect import bisect_left
+from typing import Optional
+
+class Piece:
+    """A span of an immutable buffer. Newline positions are found once and kept."""
+    __slots__ = ("buf", "start", "length", "_newlines")
+
+    def __init__(self, buf: str, start: int, length: int, newlines: Optional[list[int]] = None):
+        self.buf = buf
+        self.start = start
+        self.length = length
+        self._newlines = newlines
+
+    def newlines(self) -> list[int]:
+        """Offsets of the newlines in this piece, relative to the piece start."""
+        if self._newlines is None:
+            found = []
+            end = self.start + self.length
+            i = self.buf.find("\n", self.start, end)
+            while i != -1:
+                found.append(i - self.start)
+                i = self.buf.find("\n", i + 1, end)
+            self._newlines = found
+        return self._newlines
+
+    def split(self, at: int) -> tuple["Piece", "Piece"]:
+        left_nl = right_nl = None
+        if self._newlines is not None:
+            k = bisect_left(self._newlines, at)
+            left_nl = self._newlines[:k]
+            right_nl = [n - at for n in self._newlines[k:]]
+        return (
+            Piece(self.buf, self.start, at, left_nl),
+            Piece(self.buf, self.start + at, self.length - at, right_nl),
+        )
+
+    def text(self) -> str:
+        return self.buf[self.start:self.start + self.length]
+
+class PieceTable:
+    """Edit-friendly document text.
+
+    The text is a list of pieces pointing into the original string and into
+    the strings inserted by later edits, so an edit costs roughly the size of
+    the inserted text plus the number of pieces, never a copy of the whole
+    document. The joined text is built on demand and cached until the next
+    edit.
+    """
+
+    def __init__(self, text: str = ""):
+        self._reset(text)
+
+    def _reset(self, text: str):
+        self._pieces: list[Piece] = [Piece(text, 0, len(text))] if text else []
+        self._length = len(text)
+        self._text: Optional[str] = text
+
+    def __len__(self) -> int:
+        return self._length
+
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(piece.text() for piece in self._pieces)
+            # the joined text is a cheaper single piece for future edits and reads
+            self._pieces = [Piece(self._text, 0, self._length)] if self._text else []
+        return self._text
+
+    def _split_at(self, offset: int) -> int:
+        """Ensures a piece boundary at `offset` and returns the index of the piece starting there."""
+        pos = 0
+        for i, piece in enumerate(self._pieces):
+            if offset == pos:
+                return i
+            if offset < pos + piece.length:
+                left, right = piece.split(offset - pos)
+                self._pieces[i:i + 1] = [left, right]
+                return i + 1
+            pos += piece.length
+        return len(self._pieces)
+
+    def replace_range(self, start: int, end: int, new_text: str):
+        """Replaces the characters in [start, end) with `new_text`."""
+        if not 0 <= start <= end <= self._length:
+            raise ValueError(f"Invalid range {start}:{end} for a document of length {self._length}")
+
+        first = self._split_at(start)
+        last = self._split_at(end)
+        self._pieces[first:last] = [Piece(new_text, 0, len(new_text))] if new_text else []
+        self._length += len(new_text) - (end - start)
+        self._text = None
+
+    def find(self, sub: str, start: int = 0) -> int:
+        """Returns the offset of the first occurrence of `sub` at or after `start`, or -1."""
+        if not sub:
+            return start if start <= self._length else -1
+        if self._text is not None:
+            return self._text.find(sub, start)
+
+        overlap = len(sub) - 1
+        carry = ""  # the last `overlap` characters before the current piece
+        pos = 0
+        for piece in self._pieces:
+            end = piece.start + piece.length
+            if overlap and carry:
+                # a match that starts before this piece and ends inside it
+                window = carry + piece.buf[piece.start:piece.start + min(piece.length, overlap)]
+                idx = window.find(sub, max(0, start - (pos - len(carry))))
+                if idx != -1 and idx < len(carry):
+                    return pos - len(carry) + idx
+
+            lo = piece.start + max(0, start - pos)
+            if lo < end:
+                idx = piece.buf.find(sub, lo, end)
+                if idx != -1:
+                    return pos + idx - piece.start
+
+            if overlap:
+                carry = (carry + piece.buf[max(piece.start, end - overlap):end])[-overlap:]
+            pos += piece.length
+        return -1
+
+    def replace(self, old: str, new: str, occurrence: Optional[int] = None) -> int:
+        """Replaces every occurrence of `old`, or only the 1-based `occurrence`-th one.
+
+        Returns the number of replacements made.
+        """
+        if not old:
+            raise ValueError("The string to replace cannot be empty")
+
+        if occurrence is not None:
+            if occurrence < 1:
+                raise ValueError(f"occurrence starts at 1, got {occurrence}")
+            idx = -len(old)
+            for _ in range(occurrence):
+                idx = self.find(old, idx + len(old))
+                if idx == -1:
+                    return 0
+            self.replace_range(idx, idx + len(old), new)
+            return 1
+
+        # replacing every occurrence has to scan the whole text anyway, so do it in one pass
+        text = self.text()
+        count = text.count(old)
+        if count:
+            self._reset(text.replace(old, new))
+        return count
+
+    def line_count(self) -> int:
+        return sum(len(piece.newlines()) for piece in self._pieces) + 1
+
+    def line_offset(self, line: int) -> int:
+        """Returns the offset where the 1-based `line` starts."""
+        if line < 1:
+            raise ValueError(f"Line numbers start at 1, got {line}")
+        if line == 1:
+            return 0
+
+        remaining = line - 1
+        pos = 0
+        for piece in self._pieces:
+            newlines = piece.newlines()
+            if remaining <= len(newlines):
+                return pos + newlines[remaining - 1] + 1
+            remaining -= len(newlines)
+            pos += piece.length
+        raise ValueError(f"Line {line} is past the end of the document ({self.line_count()} lines)")
+
+    def line_range(self, start_line: int, end_line: int) -> tuple[int, int]:
+        """Returns the [start, end) offsets of lines start_line..end_line, excluding the last newline."""
+        if end_line < start_line:
+            raise ValueError(f"end_line ({end_line}) is before start_line ({start_line})")
+
+        start = self.line_offset(start_line)
+        if end_line >= self.line_count():
+            return start, self._length
+        return start, self.line_offset(end_line + 1) - 1
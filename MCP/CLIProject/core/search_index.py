@@ -0,0 +1,125 @@
+import math
+import re
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text: str) -> Iterable[tuple[str, int]]:
+    """Yields (lowercased term, offset) pairs for the words in `text`."""
+    for match in TOKEN_RE.finditer(text):
+        yield match.group().lower(), match.start()
+
+class SearchIndex:
+    """Inverted index over document text, ranked with BM25.
+
+    Postings map each term to the documents containing it and the offsets of
+    its first occurrences, so a search only touches the documents that share
+    a term with the query. Edited documents are only marked stale and are
+    re-indexed on the next search, replacing just that document's postings.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    # offsets kept per term and document, enough to place a snippet
+    MAX_OFFSETS = 4
+
+    def __init__(self):
+        self._postings: dict[str, dict[str, tuple[int, list[int]]]] = {}
+        self._doc_terms: dict[str, list[str]] = {}
+        self._doc_lengths: dict[str, int] = {}
+        self._total_length = 0
+        self._stale: set[str] = set()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_terms
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def index(self, doc_id: str, text: str):
+        """Adds a document, replacing any earlier version of it."""
+        self.remove(doc_id)
+
+        counts: Counter = Counter()
+        offsets: dict[str, list[int]] = {}
+        for term, offset in tokenize(text):
+            counts[term] += 1
+            term_offsets = offsets.setdefault(term, [])
+            if len(term_offsets) < self.MAX_OFFSETS:
+                term_offsets.append(offset)
+
+        for term, count in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = (count, offsets[term])
+
+        length = sum(counts.values())
+        self._doc_terms[doc_id] = list(counts)
+        self._doc_lengths[doc_id] = length
+        self._total_length += length
+
+    def mark_stale(self, doc_id: str):
+        """Schedules a document to be re-indexed before the next search."""
+        self._stale.add(doc_id)
+
+    def _refresh_stale(self, get_text: Callable[[str], Optional[str]]):
+        for doc_id in self._stale:
+            text = get_text(doc_id)
+            if text is None:
+                self.remove(doc_id)
+            else:
+                self.index(doc_id, text)
+        self._stale.clear()
+
+    def remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+
+        for term in terms:
+            docs = self._postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+
+    def search(
+            self,
+            query: str,
+            get_text: Callable[[str], Optional[str]],
+            limit: int = 10,
+            snippet_chars: int = 160,
+    ) -> list[dict]:
+        """Returns the best matching documents with a snippet around the first hit."""
+        self._refresh_stale(get_text)
+        terms = list(dict.fromkeys(term for term, _ in tokenize(query)))
+        if not terms or not self._doc_terms:
+            return []
+
+        doc_count = len(self._doc_terms)
+        avg_length = self._total_length / doc_count or 1
+        scores: Counter = Counter()
+        first_hits: dict[str, int] = {}
+
+        for term in terms:
+            docs = self._postings.get(term)
+            if not docs:
+                continue
+
+            idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, (count, offsets) in docs.items():
+                norm = self.K1 * (1 - self.B + self.B * self._doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * count * (self.K1 + 1) / (count + norm)
+                first_hits[doc_id] = min(first_hits.get(doc_id, offsets[0]), offsets[0])
+
+        results = []
+        for doc_id, score in scores.most_common(limit):
+            text = get_text(doc_id) or ""
+            offset = first_hits[doc_id]
+            start = max(0, offset - snippet_chars // 2)
+            results.append({
+                "doc_id": doc_id,
+                "score": round(score, 4),
+                "offset": offset,
+                "snippet": text[start:start + snippet_chars],
+            })
+        return results
@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+class StartupProfiler:
+    """Times the phases of startup and the modules each phase imported."""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        # (phase, seconds, modules imported during the phase)
+        self.phases: list[tuple[str, float, int]] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        modules = len(sys.modules)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started, len(sys.modules) - modules))
+
+    def report(self) -> str:
+        total = time.perf_counter() - self.started
+        width = max([len(name) for name, _, _ in self.phases] + [len("phase")])
+        lines = [f"{'phase':<{width}}  {'ms':>8}  {'modules':>7}"]
+        for name, seconds, modules in self.phases:
+            lines.append(f"{name:<{width}}  {seconds * 1000:>8.1f}  {modules:>7}")
+        lines.append(f"{'total':<{width}}  {total * 1000:>8.1f}  {len(sys.modules):>7}")
+        return "\n".join(lines)
+
+class CatalogSnapshot:
+    """The prompts, resource ids and tool definitions seen on the last run.
+
+    Loading the snapshot lets the CLI show its prompt, with completions,
+    before the servers have answered. It is only used when it was taken with
+    the same set of servers, and is replaced once the live catalog has been
+    fetched.
+    """
+
+    def __init__(self, path: str, servers: list[str]):
+        self.path = path
+        self.servers = servers
+
+    def load(self) -> Optional[dict]:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable catalog snapshot {self.path}: {e!r}")
+            return None
+
+        if data.get("version") != SNAPSHOT_VERSION or data.get("servers") != self.servers:
+            return None
+        return data
+
+    def save(self, prompts: list, resources: list[str], tools: list[dict]):
+        """Writes the catalog atomically, so a crash never leaves a half-written snapshot."""
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "servers": self.servers,
+            "prompts": [prompt.model_dump(mode="json") for prompt in prompts],
+            "resources": list(resources),
+            "tools": tools,
+        }
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save catalog snapshot {self.path}: {e!r}")
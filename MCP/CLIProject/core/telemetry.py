@@ -0,0 +1,201 @@
+import contextvars
+import json
+import math
+import os
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+from pydantic import BaseModel
+
+def _json_default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return str(value)
+
+def payload_bytes(value: Any) -> int:
+    """Approximate size of a payload on the wire, as JSON."""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, BaseModel):
+        return len(value.model_dump_json())
+    return len(json.dumps(value, default=_json_default))
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(q / 100 * len(sorted_values))
+    return sorted_values[min(len(sorted_values) - 1, max(0, rank - 1))]
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = self.start_ns
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds."""
+        return (self.end_ns - self.start_ns) / 1e9
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+class Tracer:
+    """Times named spans of work across the agent loop.
+
+    Spans nest through a context variable, so work started inside a span,
+    including tasks created there, shares its trace. Numeric attributes such
+    as token counts and payload bytes are summed per span name. Finished
+    spans are kept in a bounded buffer for export, and the durations of the
+    last `max_samples` spans of each name are kept for percentiles.
+    """
+
+    def __init__(self, service_name: str = "mcp-chat", max_spans: int = 10_000, max_samples: int = 10_000):
+        self.service_name = service_name
+        self.enabled = True
+        self.max_samples = max_samples
+        self._spans: deque[Span] = deque(maxlen=max_spans)
+        self._durations: dict[str, deque[float]] = {}
+        self._counts: Counter = Counter()
+        self._errors: Counter = Counter()
+        self._totals: dict[str, Counter] = {}
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Times the enclosed block. Attributes can be added to the yielded span."""
+        parent = _current_span.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+        token = _current_span.set(span)
+        started = time.perf_counter_ns()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = span.start_ns + time.perf_counter_ns() - started
+            if self.enabled:
+                self._record(span)
+
+    def _record(self, span: Span):
+        self._spans.append(span)
+        durations = self._durations.get(span.name)
+        if durations is None:
+            durations = self._durations[span.name] = deque(maxlen=self.max_samples)
+        durations.append(span.duration)
+        self._counts[span.name] += 1
+        if span.error:
+            self._errors[span.name] += 1
+
+        totals = self._totals.setdefault(span.name, Counter())
+        for key, value in span.attributes.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[key] += value
+
+    def reset(self):
+        self._spans.clear()
+        self._durations.clear()
+        self._counts.clear()
+        self._errors.clear()
+        self._totals.clear()
+
+    def stats(self) -> dict[str, dict]:
+        """Per span name: count, errors, p50/p95/p99/max in milliseconds and attribute totals."""
+        stats = {}
+        for name in sorted(self._durations):
+            durations = sorted(self._durations[name])
+            stats[name] = {
+                "count": self._counts[name],
+                "errors": self._errors[name],
+                **{
+                    f"p{q}_ms": percentile(durations, q) * 1000
+                    for q in (50, 95, 99)
+                },
+                "max_ms": durations[-1] * 1000,
+                "totals": dict(self._totals.get(name, {})),
+            }
+        return stats
+
+    def report(self) -> str:
+        """Formats the stats as a table for the /stats command."""
+        stats = self.stats()
+        if not stats:
+            return "No spans recorded yet."
+
+        width = max(len(name) for name in stats)
+        lines = [
+            f"{'span':<{width}}  {'count':>6}  {'errors':>6}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'max ms':>9}"
+        ]
+        for name, s in stats.items():
+            lines.append(
+                f"{name:<{width}}  {s['count']:>6}  {s['errors']:>6}  {s['p50_ms']:>9.1f}  "
+                f"{s['p95_ms']:>9.1f}  {s['p99_ms']:>9.1f}  {s['max_ms']:>9.1f}"
+            )
+            if s["totals"]:
+                lines.append(" " * (width + 2) + ", ".join(f"{key}={value:g}" for key, value in s["totals"].items()))
+        return "\n".join(lines)
+
+    @staticmethod
+    def _otel_value(value) -> dict:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def to_otel(self) -> dict:
+        """Returns the recorded spans in the OTLP/JSON trace format."""
+        spans = []
+        for span in self._spans:
+            otel_span = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                # SPAN_KIND_INTERNAL
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [
+                    {"key": key, "value": self._otel_value(value)}
+                    for key, value in span.attributes.items()
+                    if value is not None
+                ],
+                # STATUS_CODE_ERROR or STATUS_CODE_OK
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                otel_span["parentSpanId"] = span.parent_id
+            spans.append(otel_span)
+
+        return {
+            "resourceSpans": [{
+                "resource": {
+                    "attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}],
+                },
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }],
+        }
+
+    def export_otel(self, path: str):
+        """Writes the recorded spans to `path` as OTLP/JSON."""
+        with open(path, "w") as f:
+            json.dump(self.to_otel(), f)
+
+# shared by the whole process, so every layer reports into the same traces
+tracer = Tracer()
@@ -1,37 +1,165 @@
+from __future__ import annotations
 from mcp_client import MCP_Client
+from mcp import types
 from mcp.types import Tool, CallToolResult, TextContent
-from typing import Optional, Literal, List
-from anthropic.types import ToolResultBlockParam, Message
+from typing import TYPE_CHECKING, Optional, Literal, List
+import asyncio
 import json
+import logging
+import time
+from core.telemetry import tracer
+
+if TYPE_CHECKING:
+    from anthropic.types import ToolResultBlockParam, Message
+
+logger = logging.getLogger(__name__)
+
+class ToolCatalog:
+    """Session-lived index of the tools exposed by a set of MCP clients.
+
+    The catalog is built once with a single `list_tools()` per client and then
+    serves both the tool schemas sent to Claude and the tool name -> client
+    routing table. It is rebuilt when a server sends
+    `notifications/tools/list_changed` or when `ttl` seconds have passed.
+    It also holds the per-client call limits, so they apply across every chat
+    sharing the catalog.
+    """
+
+    def __init__(self, clients: dict[str, MCP_Client], ttl: Optional[float] = 300.0):
+        self.clients: dict[str, MCP_Client] = clients
+        self.ttl = ttl
+        self.collisions: dict[str, list[str]] = {}
+        self._tools: list[dict] = []
+        self._routes: dict[str, MCP_Client] = {}
+        self._built_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._call_slots: dict[int, asyncio.Semaphore] = {}
 
-class ToolManager:
-    @classmethod
-    async def get_all_tools(cls, clients: dict[str, MCP_Client]) -> list[Tool]:
-        """Gets all tools from the provided clients."""
-        tools = []
         for client in clients.values():
-            tool_models = await client.list_tools()
-            tools += [
-                {
+            client.add_notification_listener(self._on_notification)
+
+    async def _on_notification(self, notification: types.ServerNotification):
+        if isinstance(notification.root, types.ToolListChangedNotification):
+            logger.info("Tool list changed on a server, invalidating tool catalog")
+            self.invalidate()
+
+    def invalidate(self):
+        """Marks the catalog as stale so the next lookup rebuilds it."""
+        self._built_at = None
+
+    def _is_stale(self) -> bool:
+        if self._built_at is None:
+            return True
+        return self.ttl is not None and time.monotonic() - self._built_at > self.ttl
+
+    async def _build(self):
+        client_ids = list(self.clients.keys())
+        results = await asyncio.gather(*(self.clients[client_id].list_tools() for client_id in client_ids))
+
+        tools: list[dict] = []
+        routes: dict[str, MCP_Client] = {}
+        owners: dict[str, str] = {}
+        collisions: dict[str, list[str]] = {}
+
+        for client_id, tool_models in zip(client_ids, results):
+            for t in tool_models:
+                if t.name in routes:
+                    collisions.setdefault(t.name, [owners[t.name]]).append(client_id)
+                    continue
+
+                routes[t.name] = self.clients[client_id]
+                owners[t.name] = client_id
+                tools.append({
                     "name": t.name,
                     "description": t.description,
                     "input_schema": t.inputSchema,
-                } for t in tool_models
-            ]
-        
-        return tools
-    
+                })
+
+        for tool_name, client_ids_with_tool in collisions.items():
+            logger.warning(
+                f"Tool '{tool_name}' is exposed by several clients {client_ids_with_tool}, "
+                f"routing to '{client_ids_with_tool[0]}'"
+            )
+
+        self._tools = tools
+        self._routes = routes
+        self.collisions = collisions
+        self._built_at = time.monotonic()
+
+    def snapshot(self) -> list[dict]:
+        """Returns the tool definitions with the id of the client that owns each, to persist between runs."""
+        client_ids = {id(client): client_id for client_id, client in self.clients.items()}
+        return [
+            {"client": client_ids[id(self._routes[tool["name"]])], "tool": tool}
+            for tool in self._tools
+        ]
+
+    def load_snapshot(self, entries: list[dict]):
+        """Serves the tools of an earlier snapshot until the catalog is next rebuilt.
+
+        Entries for clients that are not configured any more are skipped.
+        """
+        tools: list[dict] = []
+        routes: dict[str, MCP_Client] = {}
+        for entry in entries:
+            client = self.clients.get(entry["client"])
+            tool = entry["tool"]
+            if client is None or tool["name"] in routes:
+                continue
+            routes[tool["name"]] = client
+            tools.append(tool)
+
+        self._tools = tools
+        self._routes = routes
+        self._built_at = time.monotonic()
+
+    async def _ensure_fresh(self) -> bool:
+        """Rebuilds the catalog if it is stale. Returns True if a rebuild happened."""
+        if not self._is_stale():
+            return False
+
+        async with self._lock:
+            if not self._is_stale():
+                return False
+            await self._build()
+            return True
+
+    async def get_tools(self) -> list[dict]:
+        """Returns the tool definitions in the format expected by the Messages API."""
+        await self._ensure_fresh()
+        return self._tools
+
+    def call_slots(self, client: MCP_Client, max_concurrency_per_client: int) -> asyncio.Semaphore:
+        """Returns the semaphore limiting concurrent calls to `client`, created on first use."""
+        # a pooled client spreads its calls over several server processes
+        return self._call_slots.setdefault(
+            id(client), asyncio.Semaphore(max_concurrency_per_client * client.pool_size)
+        )
+
+    async def get_client(self, tool_name: str) -> Optional[MCP_Client]:
+        """Returns the client that owns the tool, or None if no client has it."""
+        rebuilt = await self._ensure_fresh()
+        client = self._routes.get(tool_name)
+
+        if client is None and not rebuilt:
+            # The server may have added the tool without notifying us
+            self.invalidate()
+            await self._ensure_fresh()
+            client = self._routes.get(tool_name)
+
+        return client
+
+class ToolManager:
     @classmethod
-    async def _find_client_with_tool(cls, clients: list[MCP_Client], tool_name: str) -> Optional[MCP_Client]:
-        """Finds the first client that has the specified tool"""
-        for client in clients:
-            tools = await client.list_tools()
-            tool = next((t for t in tools if t.name == tool_name), None)
-            if tool:
-                return client
-            
-        return None
-    
+    async def get_all_tools(cls, catalog: ToolCatalog) -> list[Tool]:
+        """Gets all tools from the clients in the catalog."""
+        return await catalog.get_tools()
+
+    @classmethod
+    async def _find_client_with_tool(cls, catalog: ToolCatalog, tool_name: str) -> Optional[MCP_Client]:
+        """Finds the client that owns the specified tool"""
+        return await catalog.get_client(tool_name)
+
     @classmethod
     def _build_tool_result_part(
         cls,
@@ -46,50 +174,87 @@ class ToolManager:
             "content": text,
             "is_error": status == "error",
         }
-    
+
     @classmethod
-    async def execute_tool_requests(cls, clients: dict[str, MCP_Client], message: Message) -> List[ToolResultBlockParam]:
-        """Executes a list of tool requests against the provided clients."""
-        tool_requests = [block for block in message.content if block.type == "tool_use"]
-        tool_result_blocks: list[ToolResultBlockParam] = []
+    async def _execute_tool_request(
+        cls,
+        catalog: ToolCatalog,
+        tool_request,
+        max_concurrency_per_client: int,
+        timeout: Optional[float],
+    ) -> ToolResultBlockParam:
+        """Executes a single tool_use block and builds its tool result part."""
+        tool_id = tool_request.id
+        tool_name = tool_request.name
+        tool_input = tool_request.input
 
-        for tool_request in tool_requests:
-            tool_id = tool_request.id
-            tool_name = tool_request.name
-            tool_input = tool_request.input
+        client = await cls._find_client_with_tool(catalog=catalog, tool_name=tool_name)
 
-            client = await cls._find_client_with_tool(clients=list(clients.values()), tool_name=tool_name)
+        if not client:
+            return cls._build_tool_result_part(
+                tool_use_id=tool_id,
+                text=f"Tool '{tool_name}' not found.",
+                status="error"
+            )
 
-            if not client:
-                tool_result_part = cls._build_tool_result_part(
-                    tool_use_id=tool_id,
-                    text=f"Tool '{tool_name}' not found.",
-                    status="error"
-                )
-                continue
+        semaphore = catalog.call_slots(client, max_concurrency_per_client)
 
-            try:
-                tool_output: CallToolResult = await client.call_tool(tool_name=tool_name, tool_input=tool_input)
-                items = []
-                if tool_output:
-                    items = tool_output.content
-                
-                content_list = [item.text for item in items if isinstance(item, TextContent)]
-                content_json = json.dumps(content_list)
-                tool_result_part = cls._build_tool_result_part(
-                    tool_use_id=tool_id,
-                    text=content_json,
-                    status="error" if tool_output.isError else "success"
+        try:
+            async with semaphore:
+                tool_output: CallToolResult = await asyncio.wait_for(
+                    client.call_tool(tool_name=tool_name, tool_input=tool_input),
+                    timeout=timeout,
                 )
+            items = []
+            if tool_output:
+                items = tool_output.content
 
-            except Exception as e:
-                error_message = f"Error executing tool '{tool_name}': {str(e)}"
-                tool_result_part = cls._build_tool_result_part(
-                    tool_use_id=tool_id,
-                    text=json.dumps({"error": error_message}),
-                    status="error" if tool_output.isError else "success"
-                )
-            
-            tool_result_blocks.append(tool_result_part)
+            content_list = [item.text for item in items if isinstance(item, TextContent)]
+            content_json = json.dumps(content_list)
+            return cls._build_tool_result_part(
+                tool_use_id=tool_id,
+                text=content_json,
+                status="error" if tool_output and tool_output.isError else "success"
+            )
+
+        except asyncio.TimeoutError:
+            error_message = f"Tool '{tool_name}' timed out after {timeout} seconds"
+        except Exception as e:
+            error_message = f"Error executing tool '{tool_name}': {str(e)}"
+
+        logger.error(error_message)
+        return cls._build_tool_result_part(
+            tool_use_id=tool_id,
+            text=json.dumps({"error": error_message}),
+            status="error"
+        )
 
-        return tool_result_blocks
\ No newline at end of file
+    @classmethod
+    async def execute_tool_requests(
+        cls,
+        catalog: ToolCatalog,
+        message: Message,
+        max_concurrency_per_client: int = 4,
+        timeout: Optional[float] = 120.0,
+    ) -> List[ToolResultBlockParam]:
+        """Executes the tool requests of a message concurrently.
+
+        Calls to the same client are capped at `max_concurrency_per_client` at a
+        time, counting the calls of every chat sharing the catalog, and each
+        call is limited to `timeout` seconds. Results are returned in the same
+        order as the tool_use blocks in the message.
+        """
+        tool_requests = [block for block in message.content if block.type == "tool_use"]
+
+        with tracer.span("tools.execute_tool_requests", tool_calls=len(tool_requests)) as span:
+            results = list(await asyncio.gather(*(
+                cls._execute_tool_request(
+                    catalog=catalog,
+                    tool_request=tool_request,
+                    max_concurrency_per_client=max_concurrency_per_client,
+                    timeout=timeout,
+                )
+                for tool_request in tool_requests
+            )))
+            span.attributes["errors"] = sum(1 for result in results if result["is_error"])
+        return results
\ No newline at end of file
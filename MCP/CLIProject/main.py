@@ -1,10 +1,19 @@
+import time
+# taken before anything else is imported, for --profile-startup
+STARTED = time.perf_counter()
+
 import os
-from core.claude import Claude
 import sys
+import asyncio
+import argparse
 from contextlib import AsyncExitStack
-from mcp_client import MCP_Client
-from core.cli_chat import CliChat
-from core.cli import CliApp
+from typing import TYPE_CHECKING, Optional
+from core.startup import StartupProfiler, CatalogSnapshot
+
+if TYPE_CHECKING:
+    from mcp_client import MCP_Client
+    from core.claude import Claude
+    from core.cli import CliApp
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -23,38 +32,187 @@ ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
 assert CLAUDE_MODEL, "Error: CLAUDE_MODEL cannot be empty. Update .env"
 assert ANTHROPIC_API_KEY, "Error: ANTHROPIC_API_KEY cannot be empty. Update .env"
 
+# mcp, anthropic and prompt_toolkit are slow to import, so they are imported in main() only when needed
+SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".catalog_snapshot.json"))
+
+def log_startup_report(clients: dict[str, "MCP_Client"], total: float):
+    """Logs how long each server took to spawn and complete its handshake."""
+    logger.info(f"MCP servers ready in {total * 1000:.0f} ms")
+    for client_id, client in clients.items():
+        timings = client.startup_timings
+        if not timings:
+            logger.info(f"  {client_id}: deferred until first use")
+            continue
+        logger.info(
+            f"  {client_id}: spawn {timings['spawn'] * 1000:.0f} ms, "
+            f"initialize {timings['initialize'] * 1000:.0f} ms"
+        )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Chat with Claude over MCP servers")
+    parser.add_argument("server_scripts", nargs="*", help="extra MCP server scripts or URLs")
+    parser.add_argument("--batch", metavar="QUERIES_JSONL", help="run the queries in a JSONL file (- for stdin) instead of the interactive prompt")
+    parser.add_argument("--output", default="-", help="where to write batch results as JSONL (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "4")), help="queries run at a time in batch mode")
+    parser.add_argument("--profile-startup", action="store_true", help="print how long each startup phase and its imports took")
+    return parser.parse_args()
+
+async def run_batch(cli_args, doc_client: "MCP_Client", clients: dict[str, "MCP_Client"], claude_service: "Claude"):
+    from core.batch import BatchRunner
+    runner = BatchRunner(
+        doc_client=doc_client,
+        clients=clients,
+        claude_service=claude_service,
+        concurrency=cli_args.concurrency,
+        token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "100000")),
+    )
+    source = sys.stdin if cli_args.batch == "-" else open(cli_args.batch)
+    sink = sys.stdout if cli_args.output == "-" else open(cli_args.output, "w")
+    try:
+        await runner.run(source, sink)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    # stdout may hold the results, so the summary goes to stderr
+    print(runner.report(), file=sys.stderr)
+
+async def refresh_catalog(cli: "CliApp", snapshot: Optional[CatalogSnapshot]):
+    """Fetches the live prompts, resources and tools, and saves them for the next start."""
+    await cli.initialize()
+    catalog = cli.agent.tool_catalog
+    catalog.invalidate()
+    await catalog.get_tools()
+    if snapshot is not None:
+        snapshot.save(cli.prompts, cli.resources, catalog.snapshot())
+
+async def start_in_background(cli: "CliApp", clients: list["MCP_Client"], snapshot: Optional[CatalogSnapshot]):
+    """Connects the servers and reconciles the snapshot with them while the prompt is already up."""
+    # the clients are lazy, so requests made from the prompt meanwhile wait for the connection or retry it
+    results = await asyncio.gather(*(client.connect() for client in clients), return_exceptions=True)
+    for client, result in zip(clients, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Could not start MCP server '{client.name}': {result!r}")
+    try:
+        await refresh_catalog(cli, snapshot)
+    except Exception as e:
+        logger.warning(f"Could not refresh the catalog from the servers: {e!r}")
+
 async def main():
-    claude_service = Claude(model=CLAUDE_MODEL)
-    server_scripts = sys.argv[1:]
+    profiler = StartupProfiler(STARTED)
+    cli_args = parse_args()
+    server_scripts = cli_args.server_scripts
     clients = {}
 
+    with profiler.phase("import mcp"):
+        from mcp_client import MCP_Client, ToolCachePolicy
+    with profiler.phase("import anthropic client"):
+        from core.claude import Claude
+        from core.telemetry import tracer
+    claude_service = Claude(model=CLAUDE_MODEL)
+
     command, args = (
         ("uv", ["run", "mcp_server.py"])
         if os.getenv("USE_UV", "0") == "1"
         else ("python", ["mcp_server.py"])
     )
+    # The server only inherits a minimal environment, so forward its settings explicitly
+    doc_env = {
+        name: os.environ[name]
+        for name in ("DOCS_STORE", "DOCS_READ_LIMIT", "DOCS_CHUNK_SIZE")
+        if os.getenv(name)
+    } or None
+    # Extra servers are only started once one of their tools is needed
+    lazy_connect = os.getenv("LAZY_CONNECT", "0") == "1"
+    # Extra servers can run several processes each, for CPU-bound tools that keep no state
+    pool_size = int(os.getenv("MCP_POOL_SIZE", "1"))
+
+    # a shared document server started with MCP_TRANSPORT=streamable-http, instead of a private subprocess
+    docs_server_url = os.getenv("DOCS_SERVER_URL")
+
+    # the prompt can come up before the servers answer when the last run left a snapshot of their catalog
+    snapshot = None
+    snapshot_data = None
+    if SNAPSHOT_PATH and not cli_args.batch:
+        snapshot = CatalogSnapshot(SNAPSHOT_PATH, servers=[docs_server_url or " ".join([command, *args]), *server_scripts])
+        with profiler.phase("load catalog snapshot"):
+            snapshot_data = snapshot.load()
+    fast_start = snapshot_data is not None
 
     async with AsyncExitStack() as stack:
-        doc_client = await stack.enter_async_context(MCP_Client(command=command, args=args))
+        # an edit only makes the cached reads of the same document stale
+        doc_cache_policy = ToolCachePolicy(
+            invalidates={"edit_document": ["doc_id"]},
+            resource_keys={"docs://documents/": "doc_id"},
+            derived_resources=("docs://search/",),
+        )
+        # on a fast start every client connects in the background, and is lazy so that early requests wait for it
+        if docs_server_url:
+            doc_client = MCP_Client(url=docs_server_url, tool_cache_policy=doc_cache_policy, lazy=fast_start)
+        else:
+            doc_client = MCP_Client(command=command, args=args, env=doc_env, tool_cache_policy=doc_cache_policy, lazy=fast_start)
         clients["doc_client"] = doc_client
+        eager_clients = [doc_client]
 
         for i, server_script in enumerate(server_scripts):
             client_id = f"client_{i}_{server_script}"
-            client = await stack.enter_async_context(
-                MCP_Client(command="uv", args=["run", server_script])
+            if server_script.startswith(("http://", "https://")):
+                clients[client_id] = MCP_Client(url=server_script, lazy=lazy_connect or fast_start, pool_size=pool_size)
+            else:
+                clients[client_id] = MCP_Client(
+                    command="uv",
+                    args=["run", server_script],
+                    lazy=lazy_connect or fast_start,
+                    pool_size=pool_size,
+                )
+            if not lazy_connect:
+                eager_clients.append(clients[client_id])
+
+        for client in clients.values():
+            stack.push_async_callback(client.cleanup)
+
+        if not fast_start:
+            started = time.perf_counter()
+            with profiler.phase("connect servers"):
+                await asyncio.gather(*(client.connect() for client in eager_clients))
+            log_startup_report(clients, time.perf_counter() - started)
+
+        if cli_args.batch:
+            if cli_args.profile_startup:
+                print(profiler.report(), file=sys.stderr)
+            await run_batch(cli_args, doc_client, clients, claude_service)
+        else:
+            with profiler.phase("import prompt_toolkit"):
+                from core.cli_chat import CliChat
+                from core.cli import CliApp
+
+            chat = CliChat(
+                doc_client=doc_client,
+                clients=clients,
+                claude_service=claude_service,
+                token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "100000")),
             )
-            clients[client_id] = client
+            cli = CliApp(chat)
+            if fast_start:
+                cli.load_snapshot(snapshot_data)
+                background = asyncio.create_task(start_in_background(cli, eager_clients, snapshot))
+                # runs before the clients are cleaned up
+                stack.callback(background.cancel)
+            else:
+                with profiler.phase("fetch catalog"):
+                    await refresh_catalog(cli, snapshot)
 
-        chat = CliChat(
-            doc_client=doc_client,
-            clients=clients,
-            claude_service=claude_service,
-        )
-        cli = CliApp(chat)
-        await cli.initialize()
-        await cli.run()
+            if cli_args.profile_startup:
+                print(profiler.report(), file=sys.stderr)
+            await cli.run()
+
+    logger.info(f"Claude usage: {claude_service.usage_report()}")
+    trace_export = os.getenv("TRACE_EXPORT")
+    if trace_export:
+        tracer.export_otel(trace_export)
+        logger.info(f"Exported spans to {trace_export}")
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
     
\ No newline at end of file
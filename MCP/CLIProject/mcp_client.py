@@ -1,74 +1,713 @@
-from typing import Optional, Any
+from typing import Optional, Any, AsyncIterator, Awaitable, Callable
 from mcp import ClientSession, StdioServerParameters, types
+from mcp.shared.exceptions import McpError
 from contextlib import AsyncExitStack
+from collections import OrderedDict
 from mcp.client.stdio import stdio_client
 from pydantic import AnyUrl
+from core.telemetry import tracer, payload_bytes
+import anyio
+import binascii
 import json
+import os
+import tempfile
+from pathlib import Path
 import asyncio
+import functools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+NotificationListener = Callable[[types.ServerNotification], Awaitable[None]]
+
+def _is_connection_error(error: BaseException) -> bool:
+    """True if the request failed because the server process went away."""
+    if isinstance(error, McpError):
+        return error.error.code == types.CONNECTION_CLOSED
+    return isinstance(error, (ConnectionError, anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream))
+
+# base64 characters decoded per write when a blob is spooled to disk; a multiple of 4
+_BLOB_DECODE_STEP = 4 * 1024 * 1024
+
+class ResourcePart:
+    """One part of a resource read.
+
+    `data` is the decoded content: parsed JSON for application/json text,
+    a str for other text, bytes for a blob, or the Path of a temporary file
+    for a blob too large to keep in memory.
+    """
+
+    __slots__ = ("uri", "mime_type", "data")
+
+    def __init__(self, uri: str, mime_type: Optional[str], data: Any):
+        self.uri = uri
+        self.mime_type = mime_type
+        self.data = data
+
+    def __repr__(self) -> str:
+        return f"ResourcePart(uri={self.uri!r}, mime_type={self.mime_type!r}, data={type(self.data).__name__})"
+
+def _spool_blob(blob: str, suffix: str) -> Path:
+    """Decodes base64 into a temporary file a slice at a time, so the decoded bytes are never all in memory."""
+    fd, path = tempfile.mkstemp(prefix="mcp-blob-", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if "\n" in blob or "\r" in blob:
+                # line breaks would shift the slices off the 4-character boundaries
+                f.write(binascii.a2b_base64(blob))
+            else:
+                for start in range(0, len(blob), _BLOB_DECODE_STEP):
+                    f.write(binascii.a2b_base64(blob[start:start + _BLOB_DECODE_STEP]))
+    except BaseException:
+        os.unlink(path)
+        raise
+    return Path(path)
+
+class ToolCachePolicy:
+    """Local rules for which tool results MCP_Client may cache.
+
+    Tools the server annotates with readOnlyHint are cached by default.
+    `cacheable` adds tools the server does not annotate, `uncacheable` opts
+    tools out. `invalidates` maps a mutating tool to the input arguments that
+    identify what it changes: a call to it drops the cached results whose
+    input has the same values for those arguments, or lacks them. A call to
+    any other tool that is not cacheable clears the whole cache, since it may
+    have changed anything.
+
+    A server shared with other clients reports their changes as resource
+    updates. `resource_keys` maps a resource URI prefix to the input argument
+    that holds the rest of the URI, so an update to `docs://documents/a.md`
+    with {"docs://documents/": "doc_id"} only drops the results for
+    doc_id "a.md" and those without a doc_id. Updates to other resources
+    clear the whole cache. `derived_resources` lists URI prefixes of resources
+    computed from other resources, like search results, whose cached copies
+    are dropped whenever any resource changes.
+    """
+
+    def __init__(
+            self,
+            cacheable: tuple[str, ...] = (),
+            uncacheable: tuple[str, ...] = (),
+            invalidates: Optional[dict[str, list[str]]] = None,
+            resource_keys: Optional[dict[str, str]] = None,
+            derived_resources: tuple[str, ...] = (),
+    ):
+        self.cacheable = set(cacheable)
+        self.uncacheable = set(uncacheable)
+        self.invalidates = invalidates or {}
+        self.resource_keys = resource_keys or {}
+        self.derived_resources = derived_resources
+
+class _ServerProcess:
+    """One server process and its session, watched over by a supervisor task.
+
+    The supervisor pings the server every `ping_interval` seconds and
+    restarts the process, with exponential backoff, when it exits or stops
+    answering. A restart runs the initialize handshake again. For a server
+    reached over HTTP there is no process to spawn: a restart opens a new
+    session to the same endpoint.
+    """
+
+    def __init__(self, client: "MCP_Client", name: str):
+        self.client = client
+        self.name = name
+        self.session: Optional[ClientSession] = None
+        self.in_flight = 0
+        self.restarts = 0
+        # seconds spent spawning the server process and in the initialize handshake
+        self.startup_timings: dict[str, float] = {}
+        self.connected = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._check_now = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self._runner is not None and not self._runner.done()
+
+    def start(self) -> asyncio.Future:
+        """Starts the supervisor. The returned future resolves once the first connection is up."""
+        ready = asyncio.get_running_loop().create_future()
+        self._stop.clear()
+        self._runner = asyncio.create_task(self._supervise(ready))
+        return ready
+
+    async def stop(self):
+        self._stop.set()
+        if self._runner is not None:
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+
+    def report_failure(self, session: ClientSession):
+        """Restarts the process if `session` is still its current session."""
+        if session is self.session:
+            # new requests wait for the restarted process instead of using the dead session
+            self.session = None
+            self.connected.clear()
+            self._stop.set()
+
+    def check_health(self):
+        """Pings the server now instead of waiting for the next interval."""
+        self._check_now.set()
+
+    async def wait_session(self, timeout: Optional[float]) -> ClientSession:
+        """Returns the session, waiting up to `timeout` seconds while the process restarts."""
+        if self.session is None and self.alive:
+            waiter = asyncio.ensure_future(self.connected.wait())
+            await asyncio.wait({waiter, self._runner}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+        if self.session is None:
+            raise ConnectionError(f"MCP server '{self.name}' is not connected")
+        return self.session
+
+    async def _supervise(self, ready: asyncio.Future):
+        client = self.client
+        delay = client.restart_backoff
+        while True:
+            started = time.perf_counter()
+            try:
+                await self._serve(ready)
+            except asyncio.CancelledError:
+                ready.cancel()
+                raise
+            except Exception as e:
+                if not ready.done():
+                    # the first connection failing is reported to connect() instead of retried
+                    ready.set_exception(e)
+                    return
+                logger.error(f"MCP server '{self.name}' stopped: {e!r}")
+
+            if client._closing:
+                return
+            if self.restarts >= client.max_restarts:
+                logger.error(f"MCP server '{self.name}' failed {self.restarts} restarts, giving up")
+                return
+
+            # a process that ran for a while starts over from the shortest delay
+            if time.perf_counter() - started > client.max_restart_backoff:
+                delay = client.restart_backoff
+                self.restarts = 0
+            logger.warning(f"Restarting MCP server '{self.name}' in {delay:.1f}s")
+            self._stop.clear()
+            try:
+                await asyncio.wait_for(self._stop.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            if client._closing:
+                return
+            self._stop.clear()
+            delay = min(delay * 2, client.max_restart_backoff)
+            self.restarts += 1
+
+    def _transport(self):
+        """Returns the context manager that opens the client's transport."""
+        client = self.client
+        if client.url is None:
+            return stdio_client(server=StdioServerParameters(
+                command=client._command,
+                args=client._args,
+                env=client._env,
+            ))
+        # the HTTP clients pull in httpx, so they are only imported for servers that need them
+        if client.transport == "sse":
+            from mcp.client.sse import sse_client
+            return sse_client(client.url, headers=client._headers)
+        from mcp.client.streamable_http import streamablehttp_client
+        return streamablehttp_client(client.url, headers=client._headers)
+
+    async def _serve(self, ready: asyncio.Future):
+        """Owns the transport and session for the lifetime of one connection.
+
+        The stdio and HTTP transports use anyio task groups, which must be
+        entered and exited by the same task. Running them in a dedicated task
+        lets several clients connect concurrently and lets a lazy client
+        connect from whichever task first needs it.
+        """
+        client = self.client
+        health_check = None
+        try:
+            async with AsyncExitStack() as stack:
+                started = time.perf_counter()
+                # the HTTP transports keep one connection pool per session, so requests reuse connections
+                streams = await stack.enter_async_context(self._transport())
+                _read, _write = streams[0], streams[1]
+                spawned = time.perf_counter()
+                session = await stack.enter_async_context(ClientSession(_read, _write, message_handler=client._handle_message))
+                await asyncio.wait_for(session.initialize(), client.request_timeout)
+                self.startup_timings = {
+                    "spawn": spawned - started,
+                    "initialize": time.perf_counter() - spawned,
+                }
+                self.session = session
+                self.connected.set()
+                if ready.done():
+                    logger.info(f"MCP server '{self.name}' restarted")
+                    # whatever the server held in memory is gone with the old process
+                    client.invalidate_resource()
+                    client.invalidate_tool_results()
+                else:
+                    ready.set_result(None)
+
+                if client.ping_interval:
+                    health_check = asyncio.create_task(self._health_check(session))
+                await self._stop.wait()
+        finally:
+            if health_check is not None:
+                health_check.cancel()
+            self.connected.clear()
+            self.session = None
+
+    async def _health_check(self, session: ClientSession):
+        client = self.client
+        while True:
+            try:
+                await asyncio.wait_for(self._check_now.wait(), client.ping_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._check_now.clear()
+
+            try:
+                await asyncio.wait_for(session.send_ping(), client.ping_timeout)
+            except Exception as e:
+                logger.warning(f"MCP server '{self.name}' failed a health check: {e!r}")
+                self.report_failure(session)
+                return
 
 class MCP_Client:
+    """Client for one MCP server, or a pool of identical server processes.
+
+    The server is either spawned from `command` and `args` and spoken to
+    over stdio, or reached at `url` over streamable HTTP, or SSE when the
+    URL ends in /sse. An HTTP server can be shared by many clients, so edits
+    made by one agent are seen by the others.
+
+    Every request except a tool call must finish within `request_timeout`
+    seconds; tool calls may run as long as the tool needs, and callers such
+    as ToolManager bound them with their own per-call timeout. Server
+    processes are supervised: a process that crashes or stops answering
+    pings is restarted with backoff, and requests that are safe to repeat
+    (listings, prompts, resource reads and tools annotated as read-only or
+    idempotent) are replayed on the new process instead of failing.
+
+    With `pool_size` > 1, requests go to the least busy of several server
+    processes, which helps CPU-bound tools. Only use a pool for servers that
+    keep no state between calls.
+
+    Results of read-only tools are kept in an LRU cache of `tool_cache_size`
+    entries, keyed on the tool name and its input. See ToolCachePolicy for
+    how tools opt in and how mutating calls invalidate entries.
+
+    Resource reads decode every part of the result, text or blob. Blobs
+    larger than `blob_spool_bytes` once decoded are written to temporary
+    files, which are not cached and are deleted by cleanup().
+    """
+
     def __init__(
             self,
-            command: str,
-            args: list[str],
+            command: Optional[str] = None,
+            args: Optional[list[str]] = None,
             env: Optional[dict] = None,
+            url: Optional[str] = None,
+            headers: Optional[dict[str, str]] = None,
+            lazy: bool = False,
+            request_timeout: Optional[float] = 60.0,
+            ping_interval: Optional[float] = 30.0,
+            ping_timeout: float = 10.0,
+            max_restarts: int = 5,
+            restart_backoff: float = 0.5,
+            max_restart_backoff: float = 30.0,
+            max_replays: int = 1,
+            pool_size: int = 1,
+            tool_cache_size: int = 256,
+            tool_cache_policy: Optional[ToolCachePolicy] = None,
+            blob_spool_bytes: int = 8 * 1024 * 1024,
     ):
+        if (command is None) == (url is None):
+            raise ValueError("MCP_Client needs either a command or a url")
         self._command = command
-        self._args = args
+        self._args = args or []
         self._env = env
-        self._session: Optional[ClientSession] = None
-        self._exit_stack: AsyncExitStack = AsyncExitStack()
+        self.url = url
+        self._headers = headers
+        self.transport = "stdio" if url is None else "sse" if url.rstrip("/").endswith("/sse") else "streamable-http"
+        self.lazy = lazy
+        self.request_timeout = request_timeout
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.max_restarts = max_restarts
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        self.max_replays = max_replays
+        self._notification_listeners: list[NotificationListener] = []
+        # decoded resource contents keyed by URI, kept until the server reports a change
+        self._resource_cache: dict[str, Any] = {}
+        self._resource_fetches: dict[str, asyncio.Future] = {}
+        self._resource_generation = 0
+        # tools the server marks as read-only or idempotent, which can be replayed after a restart
+        self._replayable_tools: set[str] = set()
+        self.tool_cache_size = tool_cache_size
+        self.tool_cache_policy = tool_cache_policy or ToolCachePolicy()
+        self._read_only_tools: set[str] = set()
+        # (tool name, canonical input) -> (input, result), least recently used first
+        self._tool_cache: OrderedDict[tuple[str, str], tuple[dict, types.CallToolResult]] = OrderedDict()
+        self._tool_cache_generation = 0
+        self.tool_cache_stats = {"hits": 0, "misses": 0}
+        self.blob_spool_bytes = blob_spool_bytes
+        self._spooled_files: list[Path] = []
+        self._connect_lock = asyncio.Lock()
+        self._connected = False
+        self._closing = False
+        self.name = url if url is not None else " ".join([command, *self._args])
+        self._processes = [
+            _ServerProcess(self, self.name if pool_size <= 1 else f"{self.name} #{i}")
+            for i in range(max(1, pool_size))
+        ]
+
+    @property
+    def pool_size(self) -> int:
+        return len(self._processes)
+
+    @property
+    def startup_timings(self) -> dict[str, float]:
+        """Seconds spent spawning the (first) server process and in the initialize handshake."""
+        return self._processes[0].startup_timings
+
+    def add_notification_listener(self, listener: NotificationListener):
+        """Registers a coroutine that is called for every server notification."""
+        self._notification_listeners.append(listener)
+
+    async def _handle_message(self, message):
+        if not isinstance(message, types.ServerNotification):
+            return
+
+        notification = message.root
+        if isinstance(notification, types.ResourceUpdatedNotification):
+            uri = str(notification.params.uri)
+            self.invalidate_resource(uri)
+            self._invalidate_after_resource_update(uri)
+        elif isinstance(notification, types.ResourceListChangedNotification):
+            self.invalidate_resource()
+        elif isinstance(notification, types.ToolListChangedNotification):
+            self.invalidate_tool_results()
+
+        for listener in list(self._notification_listeners):
+            await listener(message)
 
     async def connect(self):
-        server_params = StdioServerParameters(
-            command=self._command,
-            args=self._args,
-            env=self._env,
-        )
-        stdio_transport = await self._exit_stack.enter_async_context(stdio_client(server=server_params))
-        _stdio, _write = stdio_transport
-        self._session = await self._exit_stack.enter_async_context(ClientSession(_stdio, _write))
-        await self._session.initialize()
+        if self._connected:
+            return
+
+        async with self._connect_lock:
+            if self._connected:
+                return
+
+            self._closing = False
+            with tracer.span("mcp.connect", server=self.name):
+                results = await asyncio.gather(
+                    *(process.start() for process in self._processes),
+                    return_exceptions=True,
+                )
+                errors = [result for result in results if isinstance(result, BaseException)]
+                if errors:
+                    await self._stop_processes()
+                    raise errors[0]
+            self._connected = True
+
+    def _pick_process(self) -> _ServerProcess:
+        """Returns the least busy connected process, or any live one while they all restart."""
+        connected = [process for process in self._processes if process.session is not None]
+        candidates = connected or [process for process in self._processes if process.alive] or self._processes
+        return min(candidates, key=lambda process: process.in_flight)
 
     def session(self) -> ClientSession:
-        if self._session is None:
+        session = self._pick_process().session
+        if session is None:
             raise ConnectionError(
                 "Client session not initialized or cache not populated. Call connect first."
             )
-        return self._session
-    
+        return session
+
+    async def _request(
+            self,
+            method: str,
+            operation: Callable[[ClientSession], Awaitable[Any]],
+            replayable: bool = True,
+            measure: Callable[[Any], int] = payload_bytes,
+            deadline: bool = True,
+            **span_attributes,
+    ) -> Any:
+        """Runs `operation` on the session of the least busy server process.
+
+        With `deadline`, the operation must finish within `request_timeout`
+        seconds, and a request that times out triggers an immediate health
+        check. A replayable request whose server died before answering is
+        sent again once the process has been restarted.
+        """
+        if not self._connected:
+            if not self.lazy:
+                raise ConnectionError(
+                    "Client session not initialized or cache not populated. Call connect first."
+                )
+            await self.connect()
+
+        with tracer.span(f"mcp.{method}", server=self.name, **span_attributes) as span:
+            replays = 0
+            while True:
+                process = self._pick_process()
+                session = await process.wait_session(self.request_timeout)
+                process.in_flight += 1
+                try:
+                    result = await asyncio.wait_for(operation(session), self.request_timeout if deadline else None)
+                    if tracer.enabled:
+                        span.attributes["response_bytes"] = measure(result)
+                    return result
+                except asyncio.TimeoutError:
+                    process.check_health()
+                    raise
+                except Exception as e:
+                    if not _is_connection_error(e):
+                        raise
+                    process.report_failure(session)
+                    if not replayable or replays >= self.max_replays:
+                        raise
+                    replays += 1
+                    span.attributes["replays"] = replays
+                    logger.warning(f"Lost connection to MCP server '{process.name}', replaying request")
+                finally:
+                    process.in_flight -= 1
+
     async def list_tools(self) -> list[types.Tool]:
-        results = await self.session().list_tools()
+        results = await self._request("list_tools", lambda session: session.list_tools())
+        self._replayable_tools = {
+            tool.name
+            for tool in results.tools
+            if tool.annotations and (tool.annotations.readOnlyHint or tool.annotations.idempotentHint)
+        }
+        self._read_only_tools = {
+            tool.name
+            for tool in results.tools
+            if tool.annotations and tool.annotations.readOnlyHint
+        }
         return results.tools
 
+    def _is_cacheable(self, tool_name: str) -> bool:
+        policy = self.tool_cache_policy
+        if tool_name in policy.uncacheable:
+            return False
+        return tool_name in policy.cacheable or tool_name in self._read_only_tools
+
     async def call_tool(self, tool_name: str, tool_input) -> types.CallToolResult | None:
-        return await self.session().call_tool(tool_name, tool_input)
+        if not self._is_cacheable(tool_name):
+            try:
+                return await self._request(
+                    "call_tool",
+                    lambda session: session.call_tool(tool_name, tool_input),
+                    replayable=tool_name in self._replayable_tools,
+                    deadline=False,
+                    tool=tool_name,
+                    request_bytes=payload_bytes(tool_input) if tracer.enabled else None,
+                )
+            finally:
+                # invalidated after the call, so reads that overlap the write are not cached either
+                self._invalidate_after_call(tool_name, tool_input)
+
+        call = functools.partial(
+            self._request,
+            "call_tool",
+            lambda session: session.call_tool(tool_name, tool_input),
+            deadline=False,
+            tool=tool_name,
+            request_bytes=payload_bytes(tool_input) if tracer.enabled else None,
+        )
+        if self.tool_cache_size <= 0:
+            return await call()
+
+        key = (tool_name, json.dumps(tool_input, sort_keys=True, separators=(",", ":"), default=str))
+        cached = self._tool_cache.get(key)
+        if cached is not None:
+            self._tool_cache.move_to_end(key)
+            self.tool_cache_stats["hits"] += 1
+            with tracer.span("mcp.call_tool.cache_hit", server=self.name, tool=tool_name):
+                return cached[1]
+
+        self.tool_cache_stats["misses"] += 1
+        generation = self._tool_cache_generation
+        result = await call()
+        # errors are not cached, nor results that a mutating call may have made stale meanwhile
+        if result is not None and not result.isError and generation == self._tool_cache_generation:
+            self._tool_cache[key] = (tool_input or {}, result)
+            if len(self._tool_cache) > self.tool_cache_size:
+                self._tool_cache.popitem(last=False)
+        return result
+
+    def _invalidate_after_call(self, tool_name: str, tool_input):
+        arg_names = self.tool_cache_policy.invalidates.get(tool_name)
+        if arg_names is None:
+            self.invalidate_tool_results()
+            return
+
+        touched = {name: (tool_input or {}).get(name) for name in arg_names}
+        # results without those arguments, like a search, may depend on anything and are dropped too
+        self.invalidate_tool_results(lambda cached_input: all(
+            cached_input.get(name, value) == value for name, value in touched.items()
+        ))
+
+    def _invalidate_after_resource_update(self, uri: str):
+        for prefix, arg_name in self.tool_cache_policy.resource_keys.items():
+            if uri.startswith(prefix):
+                value = uri[len(prefix):]
+                self.invalidate_tool_results(lambda cached_input: cached_input.get(arg_name, value) == value)
+                return
+        self.invalidate_tool_results()
+
+    def invalidate_tool_results(self, matches: Optional[Callable[[dict], bool]] = None):
+        """Drops the cached tool results whose input `matches`, or all of them."""
+        self._tool_cache_generation += 1
+        if matches is None:
+            self._tool_cache.clear()
+            return
+
+        for key, (cached_input, _result) in list(self._tool_cache.items()):
+            if matches(cached_input):
+                del self._tool_cache[key]
 
     async def list_prompts(self) -> list[types.Prompt]:
-        results = await self.session().list_prompts()
+        results = await self._request("list_prompts", lambda session: session.list_prompts())
         return results.prompts
 
     async def get_prompt(self, prompt_name: str, args: dict[str, str]):
-        results = await self.session().get_prompt(prompt_name, args)
+        results = await self._request("get_prompt", lambda session: session.get_prompt(prompt_name, args), prompt=prompt_name)
         return results.messages
 
-    async def read_resource(self, uri: str) -> Any:
-        results = await self.session().read_resource(AnyUrl(uri))
-        resource = results.contents[0]
+    async def _decode_part(self, part) -> ResourcePart:
+        uri = str(part.uri)
+        if isinstance(part, types.TextResourceContents):
+            data = json.loads(part.text) if part.mimeType == "application/json" else part.text
+            return ResourcePart(uri, part.mimeType, data)
 
-        if isinstance(resource, types.TextResourceContents):
-            if resource.mimeType == "application/json":
-                return json.loads(resource.text)
-            
-            return resource.text
+        # base64 decodes to 3 bytes per 4 characters
+        if len(part.blob) // 4 * 3 <= self.blob_spool_bytes:
+            # a2b_base64 reads the ASCII str in place instead of encoding a bytes copy first
+            return ResourcePart(uri, part.mimeType, binascii.a2b_base64(part.blob))
+
+        path = await asyncio.to_thread(_spool_blob, part.blob, Path(uri).suffix)
+        self._spooled_files.append(path)
+        return ResourcePart(uri, part.mimeType, path)
+
+    async def _fetch_resource_parts(self, uri: str) -> list[ResourcePart]:
+        results = await self._request(
+            "read_resource",
+            lambda session: session.read_resource(AnyUrl(uri)),
+            # serializing a large blob again just to measure it would double the memory it takes
+            measure=lambda result: sum(len(getattr(part, "text", None) or getattr(part, "blob", "")) for part in result.contents),
+            uri=uri,
+        )
+        return [await self._decode_part(part) for part in results.contents]
+
+    async def _fetch_resource(self, uri: str) -> Any:
+        parts = await self._fetch_resource_parts(uri)
+        if len(parts) == 1:
+            return parts[0].data
+        return [part.data for part in parts]
+
+    async def read_resource_parts(self, uri: str) -> list[ResourcePart]:
+        """Reads every part of a resource, with its URI and MIME type. Not cached."""
+        return await self._fetch_resource_parts(uri)
+
+    def _forget_fetch(self, uri: str, fetch: asyncio.Future):
+        if self._resource_fetches.get(uri) is fetch:
+            del self._resource_fetches[uri]
+
+    async def read_resource(self, uri: str, use_cache: bool = True) -> Any:
+        """Returns the decoded content of a resource, or a list of them if it has several parts.
+
+        See ResourcePart for how each part is decoded.
+        """
+        if not use_cache:
+            return await self._fetch_resource(uri)
+
+        if uri in self._resource_cache:
+            with tracer.span("mcp.read_resource.cache_hit", server=self.name, uri=uri):
+                return self._resource_cache[uri]
+
+        # concurrent misses for the same URI share a single request
+        fetch = self._resource_fetches.get(uri)
+        if fetch is None:
+            fetch = asyncio.ensure_future(self._fetch_resource(uri))
+            self._resource_fetches[uri] = fetch
+            fetch.add_done_callback(functools.partial(self._forget_fetch, uri))
+
+        generation = self._resource_generation
+        contents = await asyncio.shield(fetch)
+        # don't cache a result that was invalidated while it was in flight, or temp files the caller may delete
+        if generation == self._resource_generation and not self._has_spooled_files(contents):
+            self._resource_cache[uri] = contents
+        return contents
+
+    @staticmethod
+    def _has_spooled_files(contents: Any) -> bool:
+        if isinstance(contents, list):
+            return any(isinstance(item, Path) for item in contents)
+        return isinstance(contents, Path)
+
+    async def read_resources(self, uris: list[str]) -> list[Any]:
+        """Reads several resources, fetching the cache misses concurrently."""
+        return list(await asyncio.gather(*(self.read_resource(uri) for uri in uris)))
+
+    async def read_resource_chunks(self, uri: str) -> AsyncIterator[Any]:
+        """Reads a large resource one chunk at a time, fetching each chunk only when it is needed.
+
+        Follows the server's `{uri}/chunks/{cursor}` convention: every chunk is
+        a JSON object with the chunk's "text" and a "next_cursor", which is
+        null on the last one. Chunks are not cached.
+        """
+        cursor = "0"
+        while cursor is not None:
+            chunk = await self.read_resource(f"{uri}/chunks/{cursor}", use_cache=False)
+            yield chunk["text"]
+            cursor = chunk.get("next_cursor")
+
+    def invalidate_resource(self, uri: Optional[str] = None):
+        """Drops a cached resource and the cached parts of it, or the whole cache when no URI is given."""
+        self._resource_generation += 1
+        if uri is None:
+            self._resource_cache.clear()
+            self._resource_fetches.clear()
+            return
+
+        # parts of a resource, like docs://documents/a.md/lines/1/10, change with it,
+        # and so do resources derived from others, like docs://search/{query}
+        prefixes = (f"{uri}/", *self.tool_cache_policy.derived_resources)
+        for cache in (self._resource_cache, self._resource_fetches):
+            for key in [key for key in cache if key == uri or key.startswith(prefixes)]:
+                del cache[key]
+
+    async def _stop_processes(self):
+        self._closing = True
+        await asyncio.gather(*(process.stop() for process in self._processes))
+
+    def _remove_spooled_files(self):
+        for path in self._spooled_files:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        self._spooled_files.clear()
 
     async def cleanup(self):
-        await self._exit_stack.aclose()
+        self._remove_spooled_files()
+        if not self._connected:
+            return
+
+        await self._stop_processes()
+        self._connected = False
 
     async def __aenter__(self):
-        await self.connect()
+        if not self.lazy:
+            await self.connect()
         return self
-    
+
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.cleanup()
 
@@ -82,4 +721,4 @@ async def main():
 
 if __name__ == "__main__":
     import asyncio
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -6,47 +6,189 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-from mcp.server.fastmcp import FastMCP
-from pydantic import Field
+from mcp.server.fastmcp import FastMCP, Context
+from mcp.server.session import ServerSession
+from pydantic import Field, AnyUrl
 from mcp.server.fastmcp.prompts import base
+from mcp.types import ToolAnnotations
+from core.document_store import create_document_store, DEFAULT_DOCS
+from core.search_index import SearchIndex
+from urllib.parse import unquote
+import json
+import os
+import weakref
+from typing import Optional
 
-mcp = FastMCP(name="Document MCP", log_level="ERROR")
+# stdio serves the one client that spawned the server; streamable-http and sse serve many on MCP_HOST:MCP_PORT
+TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+
+mcp = FastMCP(
+    name="Document MCP",
+    log_level="ERROR",
+    host=os.getenv("MCP_HOST", "127.0.0.1"),
+    port=int(os.getenv("MCP_PORT", "8000")),
+)
 logger.info("Starting Document MCP server...")
 
-DOCS = {
-    "deposition.md": "This deposition covers the testimony of Angela Smith, P.E.",
-    "report.pdf": "The report details the state of a 20m condenser tower.",
-    "financials.docx": "These financials outline the project's budget and expenditures.",
-    "outlook.pdf": "This document presents the projected future performance of the system.",
-    "plan.md": "The plan outlines the steps for the project's implementation.",
-    "spec.txt": "These specifications define the technical requirements for the equipment.",
-}
+# e.g. DOCS_STORE=sqlite:///docs.db to keep documents (and edits) across restarts
+DOCS = create_document_store(os.getenv("DOCS_STORE", "memory://"))
+DOCS.seed(DEFAULT_DOCS)
+
+# reads that don't give a limit are capped, so one large document can't fill the context window
+READ_LIMIT = int(os.getenv("DOCS_READ_LIMIT", "20000"))
+# characters per chunk of docs://documents/{doc_id}/chunks/{cursor}
+CHUNK_SIZE = int(os.getenv("DOCS_CHUNK_SIZE", "16000"))
+
+# built on the first search so startup doesn't have to read every document
+_search_index: Optional[SearchIndex] = None
+
+def get_search_index() -> SearchIndex:
+    global _search_index
+    if _search_index is None:
+        _search_index = SearchIndex()
+        for doc_id in DOCS.ids():
+            _search_index.index(doc_id, DOCS.get(doc_id) or "")
+    return _search_index
+
+def search(query: str, limit: int) -> list[dict]:
+    return get_search_index().search(query, get_text=DOCS.get, limit=limit)
+
+def read_region(
+    doc_id: str,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+) -> tuple[str, int, int, bool]:
+    """Returns the text of a region of a document, where it starts, the document's length
+    and whether the text stops before the region does.
+
+    The region is either the document from `offset` on, cut off at `limit`
+    characters, or the lines `start_line` to `end_line` (to the end of the
+    document by default), also cut off at `limit` characters.
+    """
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("offset and limit can't be negative")
+
+    if start_line is not None:
+        lines = DOCS.read_lines(doc_id, start_line, end_line, limit)
+        if lines is None:
+            raise ValueError(f"Document with id '{doc_id}' not found.")
+        text, offset, end, length = lines
+        return text, offset, length, offset + len(text) < end
+
+    region = DOCS.read(doc_id, offset, limit)
+    if region is None:
+        raise ValueError(f"Document with id '{doc_id}' not found.")
+    text, length = region
+    return text, offset, length, offset + len(text) < length
+
+# sessions that have read documents, so an edit can be announced to every client that may have cached them
+_sessions: "weakref.WeakSet[ServerSession]" = weakref.WeakSet()
+
+def track_session():
+    _sessions.add(mcp.get_context().session)
+
+async def notify_document_updated(doc_id: str):
+    """Tells every known session that a document changed, so they drop their cached copies."""
+    uri = AnyUrl(f"docs://documents/{doc_id}")
+    for session in list(_sessions):
+        try:
+            await session.send_resource_updated(uri)
+        except Exception as e:
+            # the client went away; its session is dropped once nothing references it
+            logger.debug(f"Could not notify a session of the update to '{doc_id}': {e!r}")
+            _sessions.discard(session)
 
 # ======== tools ========
 
 @mcp.tool(
     name="read_doc_contents",
-    description="Read the contents of a document and return it as a string.",
+    description=(
+        "Read the contents of a document and return it as a string. Long documents are returned "
+        f"{READ_LIMIT} characters at a time: read further with `offset`, or read only the lines "
+        "`start_line` to `end_line`."
+    ),
+    annotations=ToolAnnotations(readOnlyHint=True),
 )
-def read_document(doc_id: str):
+def read_document(
+    doc_id: str,
+    offset: int = Field(default=0, description="Character offset to start reading at"),
+    limit: Optional[int] = Field(default=None, description=f"Maximum number of characters to return, at most {READ_LIMIT}"),
+    start_line: Optional[int] = Field(default=None, description="First line to read (1-based). Reads lines instead of starting at offset"),
+    end_line: Optional[int] = Field(default=None, description="Last line to read (inclusive). Defaults to the end of the document"),
+):
     logger.info(f"Reading document with ID: {doc_id}")
-    if doc_id not in DOCS:
-        raise ValueError(f"Document with id '{doc_id}' not found.")
-    
-    return DOCS[doc_id]
+    track_session()
+    limit = READ_LIMIT if limit is None else min(limit, READ_LIMIT)
+    content, start, length, truncated = read_region(doc_id, offset, limit, start_line, end_line)
+
+    end = start + len(content)
+    # the whole document, or all the lines asked for, needs no note
+    if start == 0 and end == length or start_line is not None and not truncated:
+        return content
+    # tell the model which part it got and how to get the rest
+    note = f"[Characters {start}-{end} of {length}."
+    if truncated:
+        note += f" Continue with offset={end}."
+    return f"{content}\n\n{note}]"
 
 @mcp.tool(
     name="edit_document",
-    description="Edit a document by replacing a string in the document's content with a new string.",
+    description=(
+        "Edit a document. Either replace `old_str` with `new_str` (every occurrence, or only the "
+        "`occurrence`-th one), or replace the lines `start_line` to `end_line` with `new_str`."
+    ),
 )
-def edit_document(doc_id: str, old_str: str, new_str: str):
+async def edit_document(
+    doc_id: str,
+    old_str: str = "",
+    new_str: str = "",
+    occurrence: Optional[int] = Field(default=None, description="Only replace the n-th occurrence of old_str (1-based)"),
+    start_line: Optional[int] = Field(default=None, description="First line to replace (1-based). Replaces lines instead of old_str"),
+    end_line: Optional[int] = Field(default=None, description="Last line to replace (inclusive). Defaults to start_line"),
+    *,
+    ctx: Context,
+):
     logger.info(f"Editing document with ID: {doc_id}, replacing '{old_str}' with '{new_str}'")
-    if doc_id not in DOCS:
+    table = DOCS.open(doc_id)
+    if table is None:
         raise ValueError(f"Document with id '{doc_id}' not found.")
-    
-    DOCS[doc_id] = DOCS[doc_id].replace(old_str, new_str)
 
-    return f"Document '{doc_id}' updated successfully."
+    if start_line is not None:
+        start, end = table.line_range(start_line, end_line if end_line is not None else start_line)
+        table.replace_range(start, end, new_str)
+        count = 1
+    else:
+        count = table.replace(old_str, new_str, occurrence)
+        if count == 0:
+            raise ValueError(f"'{old_str}' not found in document '{doc_id}'.")
+
+    DOCS.save(doc_id, table)
+    if _search_index is not None:
+        _search_index.mark_stale(doc_id)
+    # sent before the tool result, so clients drop their cached copy before the call returns
+    _sessions.add(ctx.session)
+    await notify_document_updated(doc_id)
+
+    return f"Document '{doc_id}' updated successfully ({count} replacement{'s' if count != 1 else ''})."
+
+@mcp.tool(
+    name="search_documents",
+    description=(
+        "Search all documents for words in the query. Returns the best matching documents "
+        "with their id, a relevance score, the offset of the first match and a short snippet. "
+        "Use this to find relevant documents before reading them."
+    ),
+    annotations=ToolAnnotations(readOnlyHint=True),
+)
+def search_documents(
+    query: str,
+    limit: int = Field(default=10, description="Maximum number of results"),
+):
+    logger.info(f"Searching documents for: {query}")
+    track_session()
+    return json.dumps(search(query, limit))
 
 # ======== resources ========
 
@@ -57,7 +199,7 @@ def edit_document(doc_id: str, old_str: str, new_str: str):
 def list_docs() -> list[str]:
     logger.info("Listing all document IDs.")
 
-    return list(DOCS.keys())
+    return DOCS.ids()
 
 @mcp.resource(
     uri="docs://documents/{doc_id}",
@@ -65,10 +207,59 @@ def list_docs() -> list[str]:
 )
 def fetch_doc(doc_id: str):
     logger.info(f"Fetching document with ID: {doc_id}")
-    if doc_id not in DOCS:
+    track_session()
+    content = DOCS.get(doc_id)
+    if content is None:
         raise ValueError(f"Document with id '{doc_id}' not found.")
     
-    return DOCS[doc_id]
+    return content
+
+@mcp.resource(
+    uri="docs://documents/{doc_id}/chars/{offset}/{limit}",
+    mime_type="text/plain",
+)
+def fetch_doc_chars(doc_id: str, offset: str, limit: str):
+    logger.info(f"Fetching {limit} characters at {offset} of document with ID: {doc_id}")
+    track_session()
+    return read_region(doc_id, offset=int(offset), limit=int(limit))[0]
+
+@mcp.resource(
+    uri="docs://documents/{doc_id}/lines/{start_line}/{end_line}",
+    mime_type="text/plain",
+)
+def fetch_doc_lines(doc_id: str, start_line: str, end_line: str):
+    logger.info(f"Fetching lines {start_line}-{end_line} of document with ID: {doc_id}")
+    track_session()
+    return read_region(doc_id, start_line=int(start_line), end_line=int(end_line))[0]
+
+@mcp.resource(
+    uri="docs://documents/{doc_id}/chunks/{cursor}",
+    mime_type="application/json",
+)
+def fetch_doc_chunk(doc_id: str, cursor: str) -> dict:
+    """One chunk of a document. Start with cursor "0" and follow next_cursor until it is null."""
+    logger.info(f"Fetching chunk {cursor} of document with ID: {doc_id}")
+    track_session()
+    # the cursor is opaque to clients; it is the offset of the chunk
+    text, offset, length, _ = read_region(doc_id, offset=int(cursor), limit=CHUNK_SIZE)
+    end = offset + len(text)
+    return {
+        "text": text,
+        "offset": offset,
+        "length": length,
+        "next_cursor": str(end) if end < length else None,
+    }
+
+@mcp.resource(
+    uri="docs://search/{query}",
+    mime_type="application/json",
+)
+def search_docs(query: str) -> list[dict]:
+    query = unquote(query)
+    logger.info(f"Searching documents for: {query}")
+    track_session()
+
+    return search(query, limit=10)
 
 # ======== prompts ========
 
@@ -95,4 +286,6 @@ def format_document(
     return [base.UserMessage(prompt)]
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    if TRANSPORT != "stdio":
+        logger.info(f"Serving documents over {TRANSPORT} on {mcp.settings.host}:{mcp.settings.port}")
+    mcp.run(transport=TRANSPORT)
@@ -1,14 +1,23 @@
+from typing import Optional
 from core.claude import Claude
 from mcp_client import MCPClient
-from core.tools import ToolManager
+from core.tools import ToolManager, ToolCatalog
 from anthropic.types import MessageParam
 
 
 class Chat:
-    def __init__(self, claude_service: Claude, clients: dict[str, MCPClient]):
+    def __init__(
+        self,
+        claude_service: Claude,
+        clients: dict[str, MCPClient],
+        tool_timeouts: Optional[dict[str, Optional[float]]] = None,
+    ):
         self.claude_service: Claude = claude_service
         self.clients: dict[str, MCPClient] = clients
+        # per-tool limits that replace ToolManager's default timeout
+        self.tool_timeouts: dict[str, Optional[float]] = tool_timeouts or {}
         self.messages: list[MessageParam] = []
+        self.tool_catalog: ToolCatalog = ToolCatalog(clients)
 
     async def _process_query(self, query: str):
         self.messages.append({"role": "user", "content": query})
@@ -27,13 +36,13 @@ class Chat:
             if stream and on_event:
                 response = await self.claude_service.chat_stream(
                     messages=self.messages,
-                    tools=await ToolManager.get_all_tools(self.clients),
+                    tools=await ToolManager.get_all_tools(self.tool_catalog),
                     on_event=on_event,
                 )
             else:
                 response = await self.claude_service.chat(
                     messages=self.messages,
-                    tools=await ToolManager.get_all_tools(self.clients),
+                    tools=await ToolManager.get_all_tools(self.tool_catalog),
                 )
 
             self.claude_service.add_assistant_message(self.messages, response)
@@ -42,7 +51,9 @@ class Chat:
                 if not stream:
                     print(self.claude_service.text_from_message(response))
                 tool_result_parts = await ToolManager.execute_tool_requests(
-                    self.clients, response
+                    self.tool_catalog,
+                    response,
+                    tool_timeouts=self.tool_timeouts,
                 )
 
                 self.claude_service.add_user_message(
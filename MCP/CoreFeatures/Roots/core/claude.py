@@ -1,11 +1,107 @@
 from anthropic import AsyncAnthropic
 from anthropic.types import Message
 
+CACHE_CONTROL = {"type": "ephemeral"}
+# The API accepts at most 4 cache breakpoints per request
+MAX_CACHE_BREAKPOINTS = 4
+
+
+def _with_cache_control(content) -> list | None:
+    """Copy a user message's content with a breakpoint on its last block."""
+    if isinstance(content, str):
+        if not content:
+            return None
+        return [{"type": "text", "text": content, "cache_control": CACHE_CONTROL}]
+
+    if content and isinstance(content[-1], dict):
+        return [*content[:-1], {**content[-1], "cache_control": CACHE_CONTROL}]
+
+    return None
+
+
+def add_cache_breakpoints(params: dict) -> dict:
+    """
+    Mark the tools, the system prompt and the conversation prefix as
+    cacheable, without touching the caller's message list.
+    The newest user message writes the prefix for the next loop iteration,
+    the user message before it reads the prefix of the previous call.
+    """
+    params = dict(params)
+    breakpoints = 0
+
+    if params.get("tools"):
+        params["tools"] = [
+            *params["tools"][:-1],
+            {**params["tools"][-1], "cache_control": CACHE_CONTROL},
+        ]
+        breakpoints += 1
+
+    system = params.get("system")
+    if isinstance(system, str) and system:
+        params["system"] = [
+            {"type": "text", "text": system, "cache_control": CACHE_CONTROL}
+        ]
+        breakpoints += 1
+
+    messages = list(params["messages"])
+    message_breakpoints = min(2, MAX_CACHE_BREAKPOINTS - breakpoints)
+    for i in range(len(messages) - 1, -1, -1):
+        if message_breakpoints == 0:
+            break
+        message = messages[i]
+        if message["role"] != "user":
+            continue
+        content = _with_cache_control(message["content"])
+        if content is not None:
+            messages[i] = {**message, "content": content}
+            message_breakpoints -= 1
+    params["messages"] = messages
+
+    return params
+
 
 class Claude:
-    def __init__(self, model: str):
+    def __init__(self, model: str, prompt_caching: bool = True):
         self.client = AsyncAnthropic()
         self.model = model
+        self.prompt_caching = prompt_caching
+        self.usage = {
+            "calls": 0,
+            "input_tokens": 0,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+            "output_tokens": 0,
+        }
+
+    def _record_usage(self, message: Message):
+        self.usage["calls"] += 1
+        for key in (
+            "input_tokens",
+            "cache_creation_input_tokens",
+            "cache_read_input_tokens",
+            "output_tokens",
+        ):
+            self.usage[key] += getattr(message.usage, key, None) or 0
+
+    def cache_hit_rate(self) -> float:
+        """Share of input tokens served from the prompt cache so far."""
+        total = (
+            self.usage["input_tokens"]
+            + self.usage["cache_creation_input_tokens"]
+            + self.usage["cache_read_input_tokens"]
+        )
+        if not total:
+            return 0.0
+        return self.usage["cache_read_input_tokens"] / total
+
+    def usage_report(self) -> str:
+        return (
+            f"{self.usage['calls']} calls, "
+            f"{self.usage['cache_read_input_tokens']} cache read / "
+            f"{self.usage['cache_creation_input_tokens']} cache write / "
+            f"{self.usage['input_tokens']} uncached input tokens, "
+            f"cache hit rate {self.cache_hit_rate():.0%}"
+        )
 
     def add_user_message(self, messages: list, message):
         user_message = {
@@ -60,7 +156,11 @@ class Claude:
         if system:
             params["system"] = system
 
+        if self.prompt_caching:
+            params = add_cache_breakpoints(params)
+
         message = await self.client.messages.create(**params)
+        self._record_usage(message)
         return message
 
     async def chat_stream(
@@ -94,6 +194,9 @@ class Claude:
         if system:
             params["system"] = system
 
+        if self.prompt_caching:
+            params = add_cache_breakpoints(params)
+
         async with self.client.messages.stream(**params) as stream:
             if on_event:
                 async for event in stream:
@@ -102,4 +205,6 @@ class Claude:
                 async for event in stream:
                     pass
 
-        return await stream.get_final_message()
+        message = await stream.get_final_message()
+        self._record_usage(message)
+        return message
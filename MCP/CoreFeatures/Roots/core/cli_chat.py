@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from mcp.types import Prompt, PromptMessage
 from anthropic.types import MessageParam
 
@@ -13,8 +13,13 @@ class CliChat(Chat):
         doc_client: MCPClient,
         clients: dict[str, MCPClient],
         claude_service: Claude,
+        tool_timeouts: Optional[dict[str, Optional[float]]] = None,
     ):
-        super().__init__(clients=clients, claude_service=claude_service)
+        super().__init__(
+            clients=clients,
+            claude_service=claude_service,
+            tool_timeouts=tool_timeouts,
+        )
 
         self.doc_client: MCPClient = doc_client
 
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import os
+import weakref
+from pathlib import Path
+
+from mcp.server.session import ServerSession
+from core.utils import file_url_to_path
+
+logger = logging.getLogger(__name__)
+
+
+class RootMatcher:
+    """Checks whether paths fall inside a fixed set of root directories.
+
+    Roots are resolved (following symlinks) and normalized once, up front.
+    A check resolves the requested path and looks it and each of its parents
+    up in a set, so it costs O(depth of the path) however many roots there are.
+    """
+
+    def __init__(self, roots: list[Path]):
+        self.roots = roots
+        self._prefixes = {self._normalize(root) for root in roots}
+
+    @classmethod
+    def from_uris(cls, uris) -> "RootMatcher":
+        """Build a matcher from the file:// URIs of the client's roots."""
+        return cls([file_url_to_path(uri) for uri in uris])
+
+    @staticmethod
+    def _normalize(path) -> str:
+        return os.path.normcase(os.path.realpath(path))
+
+    def allows(self, path: Path) -> bool:
+        """Return True if the path is one of the roots or inside one."""
+        current = self._normalize(path)
+        while True:
+            if current in self._prefixes:
+                return True
+
+            parent = os.path.dirname(current)
+            if parent == current:
+                return False
+            current = parent
+
+
+class SessionRoots:
+    """Caches a RootMatcher per client session.
+
+    The roots are requested from the client the first time a session needs
+    them and then reused for every tool call, until the client sends
+    notifications/roots/list_changed. Concurrent first calls share a single
+    list_roots request.
+    """
+
+    def __init__(self):
+        self._matchers: (
+            "weakref.WeakKeyDictionary[ServerSession, asyncio.Future]"
+        ) = weakref.WeakKeyDictionary()
+
+    async def _load(self, session: ServerSession) -> RootMatcher:
+        logger.info("Requesting roots from the client...")
+        roots_result = await session.list_roots()
+        return RootMatcher.from_uris(root.uri for root in roots_result.roots)
+
+    async def get(self, session: ServerSession) -> RootMatcher:
+        """
+        Return the matcher for the session's roots, requesting them if needed.
+        """
+        matcher = self._matchers.get(session)
+        if matcher is None:
+            matcher = asyncio.ensure_future(self._load(session))
+            self._matchers[session] = matcher
+
+        try:
+            return await asyncio.shield(matcher)
+        except Exception:
+            # don't keep a failed request around; the next call asks again
+            if self._matchers.get(session) is matcher:
+                del self._matchers[session]
+            raise
+
+    def invalidate(self):
+        """Forget the cached roots of every session."""
+        self._matchers.clear()
@@ -1,38 +1,146 @@
+import asyncio
 import json
+import logging
+import time
 from typing import Optional, Literal, List
+from mcp import types
 from mcp.types import CallToolResult, Tool, TextContent
 from mcp_client import MCPClient
 from anthropic.types import Message, ToolResultBlockParam
 
+logger = logging.getLogger(__name__)
+
+
+class ToolCatalog:
+    """
+    Session-lived index of the tools exposed by a set of MCP clients.
+    Built with one list_tools() per client, rebuilt on
+    notifications/tools/list_changed or once the TTL has expired.
+    Also holds the per-client call limits, shared by every chat using it.
+    """
+
+    def __init__(
+        self, clients: dict[str, MCPClient], ttl: Optional[float] = 300.0
+    ):
+        self.clients: dict[str, MCPClient] = clients
+        self.ttl = ttl
+        self.collisions: dict[str, list[str]] = {}
+        self._tools: list[dict] = []
+        self._routes: dict[str, MCPClient] = {}
+        self._built_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._call_slots: dict[int, asyncio.Semaphore] = {}
+
+        for client in clients.values():
+            client.add_notification_listener(self._on_notification)
+
+    async def _on_notification(self, notification: types.ServerNotification):
+        if isinstance(notification.root, types.ToolListChangedNotification):
+            logger.info("Tool list changed, invalidating tool catalog")
+            self.invalidate()
+
+    def invalidate(self):
+        """Mark the catalog as stale so the next lookup rebuilds it."""
+        self._built_at = None
+
+    def _is_stale(self) -> bool:
+        if self._built_at is None:
+            return True
+        return (
+            self.ttl is not None
+            and time.monotonic() - self._built_at > self.ttl
+        )
+
+    async def _build(self):
+        client_ids = list(self.clients.keys())
+        results = await asyncio.gather(
+            *(self.clients[client_id].list_tools() for client_id in client_ids)
+        )
+
+        tools: list[dict] = []
+        routes: dict[str, MCPClient] = {}
+        owners: dict[str, str] = {}
+        collisions: dict[str, list[str]] = {}
+
+        for client_id, tool_models in zip(client_ids, results):
+            for t in tool_models:
+                if t.name in routes:
+                    collisions.setdefault(t.name, [owners[t.name]]).append(
+                        client_id
+                    )
+                    continue
+
+                routes[t.name] = self.clients[client_id]
+                owners[t.name] = client_id
+                tools.append(
+                    {
+                        "name": t.name,
+                        "description": t.description,
+                        "input_schema": t.inputSchema,
+                    }
+                )
+
+        for tool_name, owner_ids in collisions.items():
+            logger.warning(
+                f"Tool '{tool_name}' is exposed by clients {owner_ids}, "
+                f"routing to '{owner_ids[0]}'"
+            )
+
+        self._tools = tools
+        self._routes = routes
+        self.collisions = collisions
+        self._built_at = time.monotonic()
+
+    async def _ensure_fresh(self) -> bool:
+        """Rebuild the catalog if stale. Returns True if it was rebuilt."""
+        if not self._is_stale():
+            return False
+
+        async with self._lock:
+            if not self._is_stale():
+                return False
+            await self._build()
+            return True
+
+    async def get_tools(self) -> list[dict]:
+        """Get the tool definitions in Messages API format."""
+        await self._ensure_fresh()
+        return self._tools
+
+    def call_slots(
+        self, client: MCPClient, max_concurrency_per_client: int
+    ) -> asyncio.Semaphore:
+        """Get the semaphore limiting concurrent calls to the client."""
+        return self._call_slots.setdefault(
+            id(client), asyncio.Semaphore(max_concurrency_per_client)
+        )
+
+    async def get_client(self, tool_name: str) -> Optional[MCPClient]:
+        """Get the client that owns the tool, or None."""
+        rebuilt = await self._ensure_fresh()
+        client = self._routes.get(tool_name)
+
+        if client is None and not rebuilt:
+            # The server may have added the tool without notifying us
+            self.invalidate()
+            await self._ensure_fresh()
+            client = self._routes.get(tool_name)
+
+        return client
+
 
 class ToolManager:
     @classmethod
-    async def get_all_tools(cls, clients: dict[str, MCPClient]) -> list[Tool]:
-        """Gets all tools from the provided clients."""
-        tools = []
-        for client in clients.values():
-            tool_models = await client.list_tools()
-            tools += [
-                {
-                    "name": t.name,
-                    "description": t.description,
-                    "input_schema": t.inputSchema,
-                }
-                for t in tool_models
-            ]
-        return tools
+    async def get_all_tools(cls, catalog: ToolCatalog) -> list[Tool]:
+        """Gets all tools from the clients in the catalog."""
+        return await catalog.get_tools()
 
     @classmethod
     async def _find_client_with_tool(
-        cls, clients: list[MCPClient], tool_name: str
+        cls, catalog: ToolCatalog, tool_name: str
     ) -> Optional[MCPClient]:
-        """Finds the first client that has the specified tool."""
-        for client in clients:
-            tools = await client.list_tools()
-            tool = next((t for t in tools if t.name == tool_name), None)
-            if tool:
-                return client
-        return None
+        """Finds the client that owns the specified tool."""
+        return await catalog.get_client(tool_name)
 
     @classmethod
     def _build_tool_result_part(
@@ -49,60 +157,91 @@ class ToolManager:
             "is_error": status == "error",
         }
 
+    @classmethod
+    async def _execute_tool_request(
+        cls,
+        catalog: ToolCatalog,
+        tool_request,
+        max_concurrency_per_client: int,
+        timeout: Optional[float],
+        tool_timeouts: dict[str, Optional[float]],
+    ) -> ToolResultBlockParam:
+        """Executes a single tool_use block and builds its result part."""
+        tool_use_id = tool_request.id
+        tool_name = tool_request.name
+        tool_input = tool_request.input
+        timeout = tool_timeouts.get(tool_name, timeout)
+
+        client = await cls._find_client_with_tool(catalog, tool_name)
+
+        if not client:
+            return cls._build_tool_result_part(
+                tool_use_id, "Could not find that tool", "error"
+            )
+
+        semaphore = catalog.call_slots(client, max_concurrency_per_client)
+
+        try:
+            async with semaphore:
+                tool_output: CallToolResult | None = await asyncio.wait_for(
+                    client.call_tool(tool_name, tool_input), timeout=timeout
+                )
+            items = []
+            if tool_output:
+                items = tool_output.content
+            content_list = [
+                item.text for item in items if isinstance(item, TextContent)
+            ]
+            content_json = json.dumps(content_list)
+            return cls._build_tool_result_part(
+                tool_use_id,
+                content_json,
+                "error"
+                if tool_output and tool_output.isError
+                else "success",
+            )
+        except asyncio.TimeoutError:
+            error_message = f"Tool '{tool_name}' timed out after {timeout}s"
+        except Exception as e:
+            error_message = f"Error executing tool '{tool_name}': {e}"
+
+        logger.error(error_message)
+        return cls._build_tool_result_part(
+            tool_use_id, json.dumps({"error": error_message}), "error"
+        )
+
     @classmethod
     async def execute_tool_requests(
-        cls, clients: dict[str, MCPClient], message: Message
+        cls,
+        catalog: ToolCatalog,
+        message: Message,
+        max_concurrency_per_client: int = 4,
+        timeout: Optional[float] = 600.0,
+        tool_timeouts: Optional[dict[str, Optional[float]]] = None,
     ) -> List[ToolResultBlockParam]:
-        """Executes a list of tool requests against the provided clients."""
+        """
+        Executes the tool requests of a message concurrently.
+        At most max_concurrency_per_client calls run against one client at
+        a time, across every chat sharing the catalog, and results keep the
+        order of the tool_use blocks.
+        Each call is limited to `timeout` seconds, unless `tool_timeouts`
+        gives the tool its own limit (None for no limit).
+        """
         tool_requests = [
             block for block in message.content if block.type == "tool_use"
         ]
-        tool_result_blocks: list[ToolResultBlockParam] = []
-        for tool_request in tool_requests:
-            tool_use_id = tool_request.id
-            tool_name = tool_request.name
-            tool_input = tool_request.input
-
-            client = await cls._find_client_with_tool(
-                list(clients.values()), tool_name
-            )
 
-            if not client:
-                tool_result_part = cls._build_tool_result_part(
-                    tool_use_id, "Could not find that tool", "error"
+        return list(
+            await asyncio.gather(
+                *(
+                    cls._execute_tool_request(
+                        catalog,
+                        tool_request,
+                        max_concurrency_per_client,
+                        timeout,
+                        tool_timeouts or {},
+                    )
+                    for tool_request in tool_requests
                 )
-                tool_result_blocks.append(tool_result_part)
-                continue
-
-            tool_output = None
-            try:
-                tool_output: CallToolResult | None = await client.call_tool(
-                    tool_name, tool_input
-                )
-                items = []
-                if tool_output:
-                    items = tool_output.content
-                content_list = [
-                    item.text for item in items if isinstance(item, TextContent)
-                ]
-                content_json = json.dumps(content_list)
-                tool_result_part = cls._build_tool_result_part(
-                    tool_use_id,
-                    content_json,
-                    "error"
-                    if tool_output and tool_output.isError
-                    else "success",
-                )
-            except Exception as e:
-                error_message = f"Error executing tool '{tool_name}': {e}"
-                print(error_message)
-                tool_result_part = cls._build_tool_result_part(
-                    tool_use_id,
-                    json.dumps({"error": error_message}),
-                    "error"
-                    if tool_output and tool_output.isError
-                    else "success",
-                )
-
-            tool_result_blocks.append(tool_result_part)
-        return tool_result_blocks
+            )
+        )
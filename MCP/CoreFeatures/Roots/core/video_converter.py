@@ -1,97 +1,799 @@
 import os
+import re
+import json
+import glob
+import shutil
 import asyncio
+import logging
+import tempfile
+from collections import deque
+from contextlib import nullcontext, suppress
 from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+# Called with {"frame", "fps", "time", "duration", "speed", "done"}
+# each time ffmpeg reports progress
+ProgressCallback = Callable[[dict], Awaitable[None]]
+
+DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+# Every ffmpeg run writes progress to stdout as key=value lines,
+# instead of stats on stderr
+FFMPEG_BASE = ["ffmpeg", "-hide_banner", "-nostats", "-progress", "pipe:1"]
+
+logger = logging.getLogger(__name__)
+
+
+def _to_number(value: Optional[str], cast=float):
+    """Parse a value of ffmpeg's progress output, which uses N/A if unknown."""
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
 
 
 class VideoConverter:
     """Handles video conversion operations using ffmpeg."""
-    
+
     # Quality presets for video conversion
     QUALITY_PRESETS = {
         "low": {"crf": "28", "preset": "fast"},
         "medium": {"crf": "23", "preset": "medium"},
         "high": {"crf": "18", "preset": "slow"},
     }
-    
+
     SUPPORTED_FORMATS = ["webm", "mkv", "avi", "mov", "gif"]
-    
+
+    # Codecs each container can hold as they are, so those streams are
+    # copied instead of re-encoded
+    COPYABLE_CODECS = {
+        "mkv": {
+            "video": {"h264", "hevc", "av1", "vp8", "vp9", "mpeg4"},
+            "audio": {"aac", "mp3", "opus", "vorbis", "flac", "ac3", "eac3"},
+        },
+        "mov": {
+            "video": {"h264", "hevc", "mpeg4", "prores"},
+            "audio": {"aac", "mp3", "alac", "ac3", "eac3"},
+        },
+        "webm": {
+            "video": {"vp8", "vp9", "av1"},
+            "audio": {"opus", "vorbis"},
+        },
+        # H.264 and AAC are what AVI is transcoded to as well, so copying
+        # them saves a full re-encode to the same codecs
+        "avi": {
+            "video": {"h264", "mpeg4", "mjpeg"},
+            "audio": {"aac", "mp3", "ac3"},
+        },
+    }
+
+    # Encoders for the streams that have to be transcoded
+    TRANSCODE_ARGS = {
+        "webm": {
+            "video": ["libvpx-vp9", "-crf", "32", "-b:v", "0"],
+            "audio": ["libopus", "-b:a", "128k"],
+        },
+        "default": {
+            "video": [
+                "libx264",
+                "-preset",
+                QUALITY_PRESETS["medium"]["preset"],
+                "-crf",
+                QUALITY_PRESETS["medium"]["crf"],
+            ],
+            "audio": ["aac", "-b:a", "128k"],
+        },
+    }
+
+    # Codec name ffprobe reports for what each encoder produces
+    ENCODER_CODECS = {
+        "libx264": "h264",
+        "libvpx-vp9": "vp9",
+        "aac": "aac",
+        "libopus": "opus",
+    }
+
+    # How far (in seconds) a segmented encode's duration may be from the
+    # source's
+    SEGMENT_DURATION_TOLERANCE = 0.5
+
+    # What ffprobe reports: the streams' codecs and the file's duration
+    PROBE_ENTRIES = (
+        "stream=index,codec_type,codec_name"
+        ":stream_disposition=attached_pic:format=duration"
+    )
+
+    # Lines of ffmpeg's stderr kept for the error of a failed conversion
+    STDERR_TAIL_LINES = 40
+
     @classmethod
     def validate_input(cls, input_path: str) -> Path:
         """Validate the input file exists and is an MP4."""
         input_file = Path(input_path)
-        
+
         if not input_file.exists():
             raise ValueError(f"Input file not found: {input_path}")
-        
+
         if not input_path.lower().endswith(".mp4"):
             raise ValueError("Input file must be an MP4 file")
-            
+
         return input_file
-    
+
     @classmethod
     def generate_output_path(cls, input_path: str, format: str) -> str:
         """Generate output path by replacing the file extension."""
         base_path = os.path.splitext(input_path)[0]
         return f"{base_path}.{format.lower()}"
-    
+
+    @classmethod
+    async def probe(
+        cls, input_path: str, slots: Optional[asyncio.Semaphore] = None
+    ) -> Optional[dict]:
+        """
+        Read the streams and duration of a file with ffprobe, once one of
+        `slots` is free. Returns None if ffprobe isn't available or can't
+        read the file.
+        """
+        async with slots if slots is not None else nullcontext():
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *["ffprobe", "-v", "error", "-of", "json"],
+                    *["-show_entries", cls.PROBE_ENTRIES],
+                    input_path,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+            except FileNotFoundError:
+                logger.warning(
+                    "ffprobe not found, every stream will be transcoded"
+                )
+                return None
+
+            try:
+                stdout, stderr = await process.communicate()
+            except BaseException:
+                if process.returncode is None:
+                    process.kill()
+                raise
+        if process.returncode != 0:
+            error = stderr.decode(errors="replace").strip()
+            logger.warning(f"ffprobe failed on {input_path}: {error}")
+            return None
+        try:
+            return json.loads(stdout)
+        except ValueError:
+            return None
+
+    @classmethod
+    def plan_conversion(
+        cls, streams: Optional[list], format: str
+    ) -> Optional[dict]:
+        """
+        Decide per stream whether to copy it or transcode it.
+
+        Like ffmpeg's default mapping, the first video stream (cover art
+        excluded) and the first audio stream are kept. Returns None when the
+        streams are unknown, in which case everything is transcoded.
+        """
+        copyable = cls.COPYABLE_CODECS.get(format.lower())
+        if not streams or copyable is None:
+            return None
+
+        selected = {}
+        for stream in streams:
+            kind = stream.get("codec_type")
+            if kind == "video" and cls._is_cover_art(stream):
+                continue
+            if kind in ("video", "audio") and kind not in selected:
+                selected[kind] = stream
+        if not selected:
+            return None
+
+        planned = []
+        for kind in ("video", "audio"):
+            stream = selected.get(kind)
+            if stream is None:
+                continue
+            codec = stream.get("codec_name")
+            action = "copy" if codec in copyable[kind] else "transcode"
+            planned.append(
+                {
+                    "index": stream["index"],
+                    "type": kind,
+                    "codec": codec,
+                    "action": action,
+                }
+            )
+
+        actions = {stream["action"] for stream in planned}
+        if actions == {"copy"}:
+            mode = "remux"
+        elif actions == {"transcode"}:
+            mode = "transcode"
+        else:
+            mode = "partial"
+        return {"mode": mode, "streams": planned}
+
+    @staticmethod
+    def _is_cover_art(stream: dict) -> bool:
+        return bool(stream.get("disposition", {}).get("attached_pic"))
+
+    @classmethod
+    def _transcode_args(cls, format: str) -> dict:
+        """The encoders for the streams of `format` that can't be copied."""
+        return cls.TRANSCODE_ARGS.get(
+            format.lower(), cls.TRANSCODE_ARGS["default"]
+        )
+
+    @staticmethod
+    def describe_plan(plan: Optional[dict]) -> str:
+        """
+        Summarize a plan for the result message,
+        e.g. "remux: video h264 copied, audio aac copied".
+        """
+        if plan is None:
+            return "transcoded"
+        streams = ", ".join(
+            f"{s['type']} {s['codec']} "
+            + ("copied" if s["action"] == "copy" else "transcoded")
+            for s in plan["streams"]
+        )
+        return f"{plan['mode']}: {streams}"
+
     @classmethod
-    def build_ffmpeg_command(cls, input_path: str, output_path: str, format: str) -> list:
-        """Build the ffmpeg command based on format settings."""
-        preset = cls.QUALITY_PRESETS["medium"]
-        
-        # Base command
-        cmd = ["ffmpeg", "-i", input_path, "-y"]
-        
+    def expected_layout(cls, plan: dict, format: str) -> list:
+        """
+        The (type, codec) of each stream that a single-pass conversion with
+        this plan writes.
+        """
+        transcode = cls._transcode_args(format)
+        layout = []
+        for s in plan["streams"]:
+            if s["action"] == "copy":
+                layout.append((s["type"], s["codec"]))
+            else:
+                encoder = transcode[s["type"]][0]
+                layout.append((s["type"], cls.ENCODER_CODECS[encoder]))
+        return layout
+
+    @staticmethod
+    def _stream_args(output_index: int, stream: dict, transcode: dict) -> list:
+        """
+        Codec options for one planned stream. They apply to the output
+        stream's index only.
+        """
+        if stream["action"] == "copy":
+            return [f"-c:{output_index}", "copy"]
+        codec, *options = transcode[stream["type"]]
+        args = [f"-c:{output_index}", codec]
+        for option, value in zip(options[::2], options[1::2]):
+            args.extend([f"{option.split(':')[0]}:{output_index}", value])
+        return args
+
+    @classmethod
+    def build_ffmpeg_command(
+        cls,
+        input_path: str,
+        output_path: str,
+        format: str,
+        threads: Optional[int] = None,
+        plan: Optional[dict] = None,
+    ) -> list:
+        """
+        Build the ffmpeg command based on format settings and, if given,
+        the stream plan.
+        """
+        transcode = cls._transcode_args(format)
+
+        cmd = [*FFMPEG_BASE, "-i", input_path, "-y"]
+
         if format.lower() == "gif":
             # Special handling for GIF conversion
-            cmd.extend([
-                "-vf", "fps=15,scale=480:-1:flags=lanczos",
-                "-c:v", "gif",
-                output_path
-            ])
-        elif format.lower() in cls.SUPPORTED_FORMATS:
+            cmd.extend(
+                [
+                    "-vf",
+                    "fps=15,scale=480:-1:flags=lanczos",
+                    "-c:v",
+                    "gif",
+                ]
+            )
+        elif format.lower() not in cls.SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported output format: {format}")
+        elif plan is None:
             # Standard video conversion
-            cmd.extend([
-                "-c:v", "libx264",
-                "-preset", preset["preset"],
-                "-crf", preset["crf"],
-                "-c:a", "aac",
-                "-b:a", "128k",
-                output_path
-            ])
+            cmd.extend(
+                ["-c:v", *transcode["video"], "-c:a", *transcode["audio"]]
+            )
         else:
-            raise ValueError(f"Unsupported output format: {format}")
-            
+            # Map the planned streams and copy or encode each one
+            for output_index, stream in enumerate(plan["streams"]):
+                cmd.extend(
+                    [
+                        "-map",
+                        f"0:{stream['index']}",
+                        *cls._stream_args(output_index, stream, transcode),
+                    ]
+                )
+
+        # Without a limit each ffmpeg starts a thread per core
+        if threads:
+            cmd.extend(["-threads", str(threads)])
+
+        cmd.append(output_path)
         return cmd
-    
+
+    @staticmethod
+    def parse_progress(snapshot: dict, duration: Optional[float]) -> dict:
+        """Turn a block of ffmpeg's -progress output into a progress report."""
+        # out_time_us is in microseconds; older ffmpeg only has out_time_ms,
+        # which despite its name is in microseconds too
+        out_time = _to_number(
+            snapshot.get("out_time_us") or snapshot.get("out_time_ms"), int
+        )
+        if out_time is not None and out_time < 0:
+            out_time = None
+        speed = snapshot.get("speed", "N/A").strip()
+        return {
+            "frame": _to_number(snapshot.get("frame"), int),
+            "fps": _to_number(snapshot.get("fps")),
+            "time": out_time / 1_000_000 if out_time is not None else None,
+            "duration": duration,
+            "speed": speed if speed != "N/A" else None,
+            "done": snapshot.get("progress") == "end",
+        }
+
     @classmethod
-    async def convert(cls, input_path: str, format: str) -> str:
+    async def convert(
+        cls,
+        input_path: str,
+        format: str,
+        threads: Optional[int] = None,
+        on_progress: Optional[ProgressCallback] = None,
+        segment_seconds: Optional[float] = None,
+        segment_workers: int = 1,
+        slots: Optional[asyncio.Semaphore] = None,
+    ) -> dict:
         """
-        Convert video file to specified format.
-        Returns success message or raises an error.
+        Convert video file to specified format, using at most `threads`
+        threads. Streams the target container can hold are copied rather
+        than re-encoded. With `segment_seconds`, a video longer than two
+        segments whose video has to be re-encoded is encoded in segments,
+        `segment_workers` at a time. Every ffmpeg and ffprobe process holds
+        one of `slots` while it runs, if given.
+        Awaits `on_progress` with every progress report from ffmpeg.
+        Returns the message, output path and stream plan, or raises an error.
+        If the call is cancelled, ffmpeg is killed and the partial output
+        removed.
         """
         # Validate input
         cls.validate_input(input_path)
-        
+
         # Generate output path
         output_path = cls.generate_output_path(input_path, format)
-        
-        # Build ffmpeg command
-        cmd = cls.build_ffmpeg_command(input_path, output_path, format)
-        
+
+        # Inspect the source to see which streams can be copied
+        plan = None
+        info = None
+        if format.lower() != "gif":
+            info = await cls.probe(input_path, slots)
+            plan = cls.plan_conversion(info and info.get("streams"), format)
+
+        duration = _to_number((info or {}).get("format", {}).get("duration"))
+        reencodes_video = plan is not None and any(
+            s["type"] == "video" and s["action"] == "transcode"
+            for s in plan["streams"]
+        )
+        if (
+            segment_seconds
+            and reencodes_video
+            and duration
+            and duration > 2 * segment_seconds
+        ):
+            try:
+                segments = await cls._convert_segmented(
+                    input_path,
+                    output_path,
+                    format,
+                    plan,
+                    duration,
+                    segment_seconds,
+                    segment_workers,
+                    threads,
+                    on_progress,
+                    slots,
+                )
+                problems = await cls.check_output(
+                    output_path, plan, format, duration, slots
+                )
+                if not problems:
+                    return {
+                        "message": (
+                            f"Successfully converted {input_path} to "
+                            f"{output_path} ({cls.describe_plan(plan)}, "
+                            f"in {segments} segments)"
+                        ),
+                        "output_path": output_path,
+                        "plan": plan,
+                        "segments": segments,
+                    }
+                logger.warning(
+                    f"Segmented encode of {input_path} doesn't match a "
+                    f"single pass: {'; '.join(problems)}"
+                )
+            except RuntimeError as e:
+                logger.warning(f"Segmented encode of {input_path} failed: {e}")
+            logger.warning(f"Converting {input_path} in a single pass instead")
+
+        try:
+            await cls._run_ffmpeg(
+                cls.build_ffmpeg_command(
+                    input_path, output_path, format, threads, plan
+                ),
+                output_path,
+                on_progress,
+                slots,
+            )
+        except RuntimeError:
+            if plan is None or plan["mode"] == "transcode":
+                raise
+            # Some streams can't be copied as they are (e.g. odd
+            # timestamps); encode them all instead
+            logger.warning(
+                f"Copying streams of {input_path} failed, transcoding instead"
+            )
+            plan = {
+                "mode": "transcode",
+                "streams": [
+                    {**stream, "action": "transcode"}
+                    for stream in plan["streams"]
+                ],
+            }
+            await cls._run_ffmpeg(
+                cls.build_ffmpeg_command(
+                    input_path, output_path, format, threads, plan
+                ),
+                output_path,
+                on_progress,
+                slots,
+            )
+
+        return {
+            "message": (
+                f"Successfully converted {input_path} to {output_path} "
+                f"({cls.describe_plan(plan)})"
+            ),
+            "output_path": output_path,
+            "plan": plan,
+        }
+
+    @classmethod
+    async def _convert_segmented(
+        cls,
+        input_path: str,
+        output_path: str,
+        format: str,
+        plan: dict,
+        duration: float,
+        segment_seconds: float,
+        workers: int,
+        threads: Optional[int],
+        on_progress: Optional[ProgressCallback],
+        slots: Optional[asyncio.Semaphore],
+    ) -> int:
+        """
+        Encode the video in segments in parallel and join them.
+        Returns the number of segments.
+
+        The video stream is cut at the first keyframe after every
+        `segment_seconds` without re-encoding, so each segment decodes on
+        its own. The encoded
+        segments are joined with the concat demuxer, and the audio is copied or
+        encoded from the source in that same last step, in one piece, so there
+        are no gaps at the segment boundaries. Each ffmpeg process holds one
+        of `slots`, so the segments share the pool's workers with every
+        other conversion.
+        """
+        transcode = cls._transcode_args(format)
+        video = next(s for s in plan["streams"] if s["type"] == "video")
+        audio = next(
+            (s for s in plan["streams"] if s["type"] == "audio"), None
+        )
+        thread_args = ["-threads", str(threads)] if threads else []
+
+        # Next to the output rather than in /tmp, which may be too small for
+        # the segments
+        workdir = tempfile.mkdtemp(
+            prefix=".segments-",
+            dir=os.path.dirname(os.path.abspath(output_path)),
+        )
+        try:
+            split = [*FFMPEG_BASE, "-i", input_path, "-y"]
+            split += ["-map", f"0:{video['index']}", "-c", "copy"]
+            split += ["-f", "segment", "-segment_time", str(segment_seconds)]
+            split += ["-reset_timestamps", "1"]
+            split.append(os.path.join(workdir, "source_%05d.mkv"))
+            await cls._run_ffmpeg(split, None, None, slots)
+            sources = sorted(glob.glob(os.path.join(workdir, "source_*.mkv")))
+            if not sources:
+                raise RuntimeError("FFmpeg produced no segments")
+
+            # Overall progress is the sum of every segment's position
+            positions = [0.0] * len(sources)
+            frames = [0] * len(sources)
+            segment_slots = asyncio.Semaphore(max(1, workers))
+
+            async def encode(index: int, source: str) -> str:
+                async def report(progress: dict):
+                    positions[index] = progress["time"] or positions[index]
+                    frames[index] = progress["frame"] or frames[index]
+                    if on_progress:
+                        await on_progress(
+                            {
+                                **progress,
+                                "time": sum(positions),
+                                "frame": sum(frames),
+                                "duration": duration,
+                                "done": False,
+                            }
+                        )
+
+                encoded = os.path.join(workdir, f"encoded_{index:05d}.mkv")
+                async with segment_slots:
+                    cmd = [*FFMPEG_BASE, "-i", source, "-y", "-map", "0:0"]
+                    cmd += cls._stream_args(0, video, transcode)
+                    cmd += [*thread_args, encoded]
+                    await cls._run_ffmpeg(cmd, encoded, report, slots)
+                return encoded
+
+            tasks = [
+                asyncio.create_task(encode(index, source))
+                for index, source in enumerate(sources)
+            ]
+            try:
+                encoded = await asyncio.gather(*tasks)
+            except BaseException:
+                # one failed or we were cancelled: stop the others, which
+                # kills their ffmpeg
+                for task in tasks:
+                    task.cancel()
+                raise
+
+            concat_list = os.path.join(workdir, "segments.txt")
+            with open(concat_list, "w") as f:
+                for path in encoded:
+                    escaped = path.replace("'", "'\\''")
+                    f.write(f"file '{escaped}'\n")
+
+            join = [*FFMPEG_BASE, "-f", "concat", "-safe", "0"]
+            join += ["-i", concat_list, "-i", input_path, "-y"]
+            join += ["-map", "0:0", "-c:0", "copy"]
+            if audio:
+                join += ["-map", f"1:{audio['index']}"]
+                join += cls._stream_args(1, audio, transcode)
+            join += [*thread_args, output_path]
+            await cls._run_ffmpeg(join, output_path, None, slots)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if on_progress:
+            await on_progress(
+                {
+                    "frame": sum(frames),
+                    "fps": None,
+                    "time": duration,
+                    "duration": duration,
+                    "speed": None,
+                    "done": True,
+                }
+            )
+        return len(sources)
+
+    @classmethod
+    async def check_output(
+        cls,
+        output_path: str,
+        plan: dict,
+        format: str,
+        duration: float,
+        slots: Optional[asyncio.Semaphore] = None,
+    ) -> list:
+        """
+        Compare a converted file with what a single-pass conversion writes:
+        the same streams with the same codecs, and the source's duration.
+        Returns the differences found.
+        """
+        info = await cls.probe(output_path, slots)
+        if info is None:
+            return ["the output can't be read"]
+
+        problems = []
+        expected = cls.expected_layout(plan, format)
+        actual = [
+            (s.get("codec_type"), s.get("codec_name"))
+            for s in info.get("streams", [])
+            if not cls._is_cover_art(s)
+        ]
+        if actual != expected:
+            problems.append(f"streams {actual} instead of {expected}")
+
+        output_duration = _to_number(info.get("format", {}).get("duration"))
+        tolerance = cls.SEGMENT_DURATION_TOLERANCE
+        if (
+            output_duration is None
+            or abs(output_duration - duration) > tolerance
+        ):
+            problems.append(
+                f"duration {output_duration}s instead of {duration}s"
+            )
+        return problems
+
+    @classmethod
+    async def _run_ffmpeg(
+        cls,
+        cmd: list,
+        output_path: Optional[str],
+        on_progress: Optional[ProgressCallback],
+        slots: Optional[asyncio.Semaphore] = None,
+    ):
+        """
+        Run one ffmpeg command once one of `slots` is free, reporting its
+        progress. Raises RuntimeError if it fails.
+        """
+        async with slots if slots is not None else nullcontext():
+            await cls._run_ffmpeg_process(cmd, output_path, on_progress)
+
+    @classmethod
+    async def _run_ffmpeg_process(
+        cls,
+        cmd: list,
+        output_path: Optional[str],
+        on_progress: Optional[ProgressCallback],
+    ):
         try:
             # Run ffmpeg asynchronously
             process = await asyncio.create_subprocess_exec(
                 *cmd,
+                stdin=asyncio.subprocess.DEVNULL,
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+                stderr=asyncio.subprocess.PIPE,
             )
-            _, stderr = await process.communicate()
-            
-            if process.returncode != 0:
-                raise RuntimeError(f"FFmpeg conversion failed: {stderr.decode()}")
-                
-            return f"Successfully converted {input_path} to {output_path}"
-            
         except FileNotFoundError:
-            raise RuntimeError("FFmpeg not found. Please ensure ffmpeg is installed and in PATH")
\ No newline at end of file
+            raise RuntimeError(
+                "FFmpeg not found. "
+                "Please ensure ffmpeg is installed and in PATH"
+            )
+
+        # Only the end of stderr is kept, so a long encode doesn't pile its
+        # log up in memory
+        stderr_tail: deque[str] = deque(maxlen=cls.STDERR_TAIL_LINES)
+        duration: Optional[float] = None
+
+        async def read_stderr():
+            nonlocal duration
+            async for line in process.stderr:
+                text = line.decode(errors="replace").rstrip()
+                if duration is None:
+                    match = DURATION_RE.search(text)
+                    if match:
+                        hours, minutes, seconds = match.groups()
+                        duration = (
+                            int(hours) * 3600
+                            + int(minutes) * 60
+                            + float(seconds)
+                        )
+                stderr_tail.append(text)
+
+        async def read_progress():
+            snapshot = {}
+            async for line in process.stdout:
+                key, _, value = (
+                    line.decode(errors="replace").strip().partition("=")
+                )
+                snapshot[key] = value
+                # every block of progress output ends with a
+                # progress=continue|end line
+                if key == "progress":
+                    if on_progress:
+                        await on_progress(
+                            cls.parse_progress(snapshot, duration)
+                        )
+                    snapshot = {}
+
+        try:
+            await asyncio.gather(read_stderr(), read_progress())
+            await process.wait()
+        except BaseException:
+            # Cancelled, or the progress callback failed: stop the encode now
+            # rather than let it run on
+            if process.returncode is None:
+                process.kill()
+            if output_path:
+                with suppress(OSError):
+                    os.remove(output_path)
+            raise
+
+        if process.returncode != 0:
+            error = "\n".join(stderr_tail)
+            raise RuntimeError(f"FFmpeg conversion failed: {error}")
+
+
+def available_cpus() -> int:
+    """Number of CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class ConversionPool:
+    """Runs ffmpeg conversions on a bounded number of workers.
+
+    Each job gets `threads_per_job` ffmpeg threads and the number of jobs
+    running at once is chosen so that together they use about as many
+    threads as there are CPUs. Every conversion, single or batch, goes
+    through the pool, so parallel tool calls can't oversubscribe the machine.
+    A slot is held by each ffmpeg and ffprobe process rather than by a
+    conversion, so the segments of a segmented conversion, up to
+    `segment_workers` at a time, take their slots from the same pool, and a
+    large batch never probes more files at once than there are workers.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        threads_per_job: Optional[int] = None,
+        segment_seconds: Optional[float] = None,
+        segment_workers: Optional[int] = None,
+    ):
+        cpus = available_cpus()
+        self.threads_per_job = max(1, threads_per_job or min(2, cpus))
+        self.workers = max(1, workers or cpus // self.threads_per_job)
+        # Long videos are split into segments of this length, encoded
+        # `segment_workers` at a time
+        self.segment_seconds = segment_seconds
+        self.segment_workers = max(1, segment_workers or self.workers)
+        self._slots = asyncio.Semaphore(self.workers)
+
+    async def convert(
+        self,
+        input_path: str,
+        format: str,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> dict:
+        """
+        Convert one file, running each of its ffmpeg and ffprobe processes
+        once a worker is free.
+        """
+        return await VideoConverter.convert(
+            input_path,
+            format,
+            threads=self.threads_per_job,
+            on_progress=on_progress,
+            segment_seconds=self.segment_seconds,
+            segment_workers=self.segment_workers,
+            slots=self._slots,
+        )
+
+    async def convert_many(self, input_paths: list[str], format: str):
+        """
+        Convert several files, yielding (input_path, result, error) as each
+        one finishes. A failed file doesn't stop the others.
+        """
+
+        async def run(input_path: str):
+            try:
+                return input_path, await self.convert(input_path, format), None
+            except Exception as e:
+                return input_path, None, str(e)
+
+        tasks = [
+            asyncio.create_task(run(input_path)) for input_path in input_paths
+        ]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            # a caller that stops early cancels the conversions that haven't
+            # finished
+            for task in tasks:
+                task.cancel()
@@ -36,11 +36,26 @@ async def main():
 
     clients = {}
 
+    # The server only inherits a minimal environment, so pass its settings on
+    # explicitly
+    server_settings = (
+        "VIDEO_WORKERS",
+        "VIDEO_THREADS_PER_JOB",
+        "VIDEO_SEGMENT_SECONDS",
+        "VIDEO_SEGMENT_WORKERS",
+    )
+    server_env = {
+        name: os.environ[name] for name in server_settings if os.getenv(name)
+    } or None
+
     async with AsyncExitStack() as stack:
         # Create the MCP client with the provided root directories
         doc_client = await stack.enter_async_context(
             MCPClient(
-                command="uv", args=["run", "mcp_server.py"], roots=root_paths
+                command="uv",
+                args=["run", "mcp_server.py"],
+                env=server_env,
+                roots=root_paths,
             )
         )
         clients["doc_client"] = doc_client
@@ -49,12 +64,16 @@ async def main():
             doc_client=doc_client,
             clients=clients,
             claude_service=claude_service,
+            # conversions report progress as they go and can run for hours
+            tool_timeouts={"convert_video": None, "convert_videos": None},
         )
 
         cli = CliApp(chat)
         await cli.initialize()
         await cli.run()
 
+    print(f"Claude usage: {claude_service.usage_report()}")
+
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,15 +1,17 @@
-from typing import Optional, Any
+from typing import Optional, Any, Awaitable, Callable
 from contextlib import AsyncExitStack
 from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
 from mcp.types import Root, ListRootsResult, ErrorData
 from mcp.shared.context import RequestContext
+from mcp.shared.session import ProgressFnT
 from pathlib import Path
 from pydantic import FileUrl
 
 import json
 from pydantic import AnyUrl
 
+import time
 import logging 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,6 +24,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+NotificationListener = Callable[[types.ServerNotification], Awaitable[None]]
+
+# Python logging level for each MCP log level
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "notice": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+    "alert": logging.CRITICAL,
+    "emergency": logging.CRITICAL,
+}
+
+
 class MCPClient:
     def __init__(
         self,
@@ -36,6 +53,28 @@ class MCPClient:
         self._roots = self._create_roots(roots) if roots else []
         self._session: Optional[ClientSession] = None
         self._exit_stack: AsyncExitStack = AsyncExitStack()
+        self._notification_listeners: list[NotificationListener] = []
+
+    def add_notification_listener(self, listener: NotificationListener):
+        """Register a coroutine called for every server notification."""
+        self._notification_listeners.append(listener)
+
+    async def _handle_message(self, message):
+        """Fan server notifications out to the registered listeners."""
+        if not isinstance(message, types.ServerNotification):
+            return
+
+        for listener in list(self._notification_listeners):
+            await listener(message)
+
+    async def _handle_log(
+        self, params: types.LoggingMessageNotificationParams
+    ):
+        """Show log messages the server sends, e.g. while a tool is running."""
+        logger.log(
+            LOG_LEVELS.get(params.level, logging.INFO),
+            f"[{params.logger or 'server'}] {params.data}",
+        )
 
     def _create_roots(self, root_paths: list[str]) -> list[Root]:
         """Convert path strings to Root objects."""
@@ -47,6 +86,14 @@ class MCPClient:
             roots.append(Root(uri=file_url, name=p.name or "Root"))
         return roots
 
+    async def set_roots(self, root_paths: list[str]):
+        """
+        Replace the roots and notify the server, which drops its cached copy.
+        """
+        self._roots = self._create_roots(root_paths)
+        if self._session is not None:
+            await self._session.send_roots_list_changed()
+
     async def _handle_list_roots(
         self, context: RequestContext["ClientSession", None]
     ) -> ListRootsResult | ErrorData:
@@ -71,6 +118,8 @@ class MCPClient:
                 list_roots_callback=self._handle_list_roots
                 if self._roots
                 else None,
+                logging_callback=self._handle_log,
+                message_handler=self._handle_message,
             )
         )
         await self._session.initialize()
@@ -91,12 +140,44 @@ class MCPClient:
         result = await self.session().list_tools()
         return result.tools
 
+    @staticmethod
+    def _log_progress(tool_name: str, interval: float = 1.0) -> ProgressFnT:
+        """
+        Build a progress callback that logs the tool's progress at most every
+        `interval` seconds.
+        """
+        last_logged = 0.0
+
+        async def on_progress(
+            progress: float, total: float | None, message: str | None
+        ):
+            nonlocal last_logged
+            now = time.monotonic()
+            if now - last_logged < interval:
+                return
+            last_logged = now
+            done = f" ({progress / total:.0%})" if total else ""
+            logger.info(f"[{tool_name}] {message or progress}{done}")
+
+        return on_progress
+
     async def call_tool(
-        self, tool_name: str, tool_input
+        self,
+        tool_name: str,
+        tool_input,
+        progress_callback: Optional[ProgressFnT] = None,
     ) -> types.CallToolResult | None:
-        """Call a specific tool with the provided input."""
+        """
+        Call a specific tool with the provided input.
+        The tool's progress notifications go to `progress_callback`, or are
+        logged.
+        """
         logger.info(f"Calling tool: {tool_name} with input: {tool_input}")
-        return await self.session().call_tool(tool_name, tool_input)
+        if progress_callback is None:
+            progress_callback = self._log_progress(tool_name)
+        return await self.session().call_tool(
+            tool_name, tool_input, progress_callback=progress_callback
+        )
 
     async def list_prompts(self) -> list[types.Prompt]:
         """List all prompts available in the current session."""
@@ -1,9 +1,16 @@
+import asyncio
+import glob
+import os
+import time
+from contextlib import aclosing
 from pathlib import Path
+from typing import Optional
+from mcp import types
 from mcp.server.fastmcp import FastMCP
 from pydantic import Field
 from mcp.server.fastmcp import Context
-from core.video_converter import VideoConverter
-from core.utils import file_url_to_path
+from core.video_converter import VideoConverter, ConversionPool
+from core.roots import SessionRoots
 
 import logging 
 logging.basicConfig(
@@ -19,28 +26,87 @@ logger = logging.getLogger(__name__)
 
 mcp = FastMCP("VidsMCP", log_level="ERROR")
 
+# Roots are fetched from the client once per session, not on every tool call
+session_roots = SessionRoots()
+
+# Shared by all tool calls, so concurrent conversions never use more threads
+# than there are CPUs
+conversion_pool = ConversionPool(
+    workers=int(os.getenv("VIDEO_WORKERS", "0")) or None,
+    threads_per_job=int(os.getenv("VIDEO_THREADS_PER_JOB", "0")) or None,
+    segment_seconds=float(os.getenv("VIDEO_SEGMENT_SECONDS", "0")) or None,
+    segment_workers=int(os.getenv("VIDEO_SEGMENT_WORKERS", "0")) or None,
+)
+
+
+async def on_roots_list_changed(
+    notification: types.RootsListChangedNotification,
+):
+    # Notifications don't say which session sent them, so every session
+    # refetches its roots
+    logger.info("Client roots changed, clearing cached roots")
+    session_roots.invalidate()
+
+
+mcp._mcp_server.notification_handlers[types.RootsListChangedNotification] = (
+    on_roots_list_changed
+)
+
+
+def progress_reporter(
+    ctx: Context, input_path: str, log_interval: float = 5.0
+):
+    """
+    Build an on_progress callback that forwards ffmpeg's progress to the
+    client: every report as a progress notification, and a log message every
+    `log_interval` seconds.
+    """
+    last_logged = 0.0
+
+    async def on_progress(progress: dict):
+        nonlocal last_logged
+        position, duration = progress["time"], progress["duration"]
+        # the fields ffmpeg couldn't report are left out
+        details = []
+        if progress["frame"] is not None:
+            details.append(f"frame {progress['frame']}")
+        if position is not None:
+            of_duration = f" of {duration:.1f}s" if duration else ""
+            details.append(f"{position:.1f}s{of_duration}")
+        if progress["speed"]:
+            details.append(f"speed {progress['speed']}")
+        if progress["done"]:
+            details.append("done")
+        message = f"{Path(input_path).name}: {', '.join(details)}"
+
+        if position is not None:
+            await ctx.report_progress(position, duration, message)
+        now = time.monotonic()
+        if progress["done"] or now - last_logged >= log_interval:
+            last_logged = now
+            await ctx.info(message)
+
+    return on_progress
+
 
 async def is_path_allowed(requested_path: Path, ctx: Context) -> bool:
-    logger.info(f"Checking if path {requested_path} is allowed...")
+    logger.debug(f"Checking if path {requested_path} is allowed...")
 
-    roots_result = await ctx.session.list_roots()
-    client_roots = roots_result.roots
+    matcher = await session_roots.get(ctx.session)
 
     if not requested_path.exists():
         logger.warning(f"Requested path does not exist: {requested_path}")
         return False
 
+    # resolve before taking the parent, so a link to a file outside the roots
+    # is caught too
+    requested_path = requested_path.resolve()
     if requested_path.is_file():
         requested_path = requested_path.parent
 
-    for root in client_roots:
-        root_path = file_url_to_path(root.uri)
-        try:
-            requested_path.relative_to(root_path)
-            logger.info(f"Path {requested_path} is within root {root_path}")
-            return True
-        except ValueError:
-            continue
+    if matcher.allows(requested_path):
+        logger.debug(f"Path {requested_path} is within a root")
+        return True
 
     logger.warning(f"Path {requested_path} is not within any root directories")
     return False
@@ -53,16 +119,115 @@ async def convert_video(
     *,
     ctx: Context,
 ):
-    """Convert an MP4 video file to another format using ffmpeg"""
+    """
+    Convert an MP4 video file to another format using ffmpeg.
+    Reports progress while it runs. Streams the target format can hold are
+    copied instead of re-encoded; the result's plan says which.
+    """
     logger.info(f"Converting video {input_path} to format {format}")
 
     input_file = VideoConverter.validate_input(input_path)
 
     # Ensure the input file is contained in a root
-    if not await is_path_allowed(input_file, ctx):
+    if not await is_path_allowed(input_file.resolve(), ctx):
         raise ValueError(f"Access to path is not allowed: {input_path}")
 
-    return await VideoConverter.convert(input_path, format)
+    # ffmpeg is killed if the client cancels the request
+    return await conversion_pool.convert(
+        input_path, format, on_progress=progress_reporter(ctx, input_path)
+    )
+
+
+def glob_base(pattern: str) -> Path:
+    """Return the part of a glob pattern before its first wildcard."""
+    base = []
+    for part in Path(pattern).parts:
+        if glob.has_magic(part):
+            break
+        base.append(part)
+    return Path(*base) if base else Path(".")
+
+
+@mcp.tool()
+async def convert_videos(
+    format: str = Field(description="Output format (e.g. 'mov')"),
+    input_paths: Optional[list[str]] = Field(
+        default=None, description="Paths of the MP4 files to convert"
+    ),
+    pattern: Optional[str] = Field(
+        default=None,
+        description=(
+            "Glob matching the MP4 files to convert, e.g. '/videos/**/*.mp4'"
+        ),
+    ),
+    *,
+    ctx: Context,
+):
+    """
+    Convert many MP4 video files to another format using ffmpeg.
+    Files are converted in parallel, as many at a time as the CPU allows.
+    Returns one result per file; a file that fails doesn't stop the others.
+    """
+    logger.info(
+        f"Converting videos {input_paths or pattern} to format {format}"
+    )
+
+    paths = list(input_paths or [])
+    if pattern:
+        # Don't scan directories outside the roots
+        if not await is_path_allowed(glob_base(pattern).resolve(), ctx):
+            raise ValueError(f"Access to path is not allowed: {pattern}")
+        paths += await asyncio.to_thread(glob.glob, pattern, recursive=True)
+    if not paths:
+        raise ValueError(
+            "Give input_paths or a pattern that matches at least one file"
+        )
+
+    results = []
+    accepted = []
+    for path in dict.fromkeys(paths):
+        try:
+            input_file = VideoConverter.validate_input(path)
+            if not await is_path_allowed(input_file.resolve(), ctx):
+                raise ValueError(f"Access to path is not allowed: {path}")
+            accepted.append(path)
+        except ValueError as e:
+            results.append(
+                {"input_path": path, "status": "error", "error": str(e)}
+            )
+
+    total = len(results) + len(accepted)
+    for result in results:
+        await ctx.warning(f"Skipped {result['input_path']}: {result['error']}")
+
+    # Report each file as it finishes instead of only when the whole batch
+    # is done. Closing the generator cancels the conversions still running if
+    # the tool call is cancelled.
+    async with aclosing(
+        conversion_pool.convert_many(accepted, format)
+    ) as conversions:
+        async for input_path, converted, error in conversions:
+            if error is None:
+                result = {
+                    "input_path": input_path,
+                    "status": "ok",
+                    "output_path": converted["output_path"],
+                    "plan": converted["plan"],
+                }
+                await ctx.info(converted["message"])
+            else:
+                result = {
+                    "input_path": input_path,
+                    "status": "error",
+                    "error": error,
+                }
+                await ctx.warning(f"Failed to convert {input_path}: {error}")
+            results.append(result)
+            await ctx.report_progress(len(results), total)
+
+    failed = sum(1 for result in results if result["status"] == "error")
+    logger.info(f"Converted {total - failed} of {total} videos")
+    return results
 
 
 @mcp.tool()
@@ -73,10 +238,9 @@ async def list_roots(ctx: Context):
     """
     logger.info("Listing all accessible root directories...")
 
-    roots_result = await ctx.session.list_roots()
-    client_roots = roots_result.roots
+    matcher = await session_roots.get(ctx.session)
 
-    return [file_url_to_path(root.uri) for root in client_roots]
+    return matcher.roots
 
 
 @mcp.tool()